@@ -0,0 +1,271 @@
+import argparse
+import json
+import logging
+import os
+
+import numpy as np
+
+from array import array
+from typing import Dict, Iterator, List, Tuple
+
+
+# Version of the cache layout, caches with another version are rebuilt
+CACHE_VERSION = 1
+CACHE_MAGIC = b"ALGNCACH"
+ALIGNMENT = 64
+
+
+class SentencePair:
+    """
+    English and German sentence with their word alignment. The alignment
+    arrays are views on the corpus arrays, the tokens are decoded on access.
+
+    Attributes:
+        id: sentence id, or the line number for files without ids.
+        english: English tokens.
+        german: German tokens.
+        source: 0-based English positions of the alignment links, -1 for
+            German tokens that are explicitly unaligned.
+        target: 0-based German positions of the alignment links.
+    """
+    __slots__ = ("id", "_corpus", "_position", "source", "target")
+
+    def __init__(self, corpus, position : int):
+        self._corpus = corpus
+        self._position = position
+        self.id = int(corpus.ids[position])
+        start, end = corpus.alignment_offsets[position:position + 2]
+        self.source = corpus.source[start:end]
+        self.target = corpus.target[start:end]
+
+    @property
+    def english(self) -> List[str]:
+        return self._corpus.tokens(self._position, "english")
+
+    @property
+    def german(self) -> List[str]:
+        return self._corpus.tokens(self._position, "german")
+
+    @property
+    def links(self) -> List[Tuple[int, int]]:
+        return list(zip(self.source.tolist(), self.target.tolist()))
+
+    def __repr__(self):
+        return "SentencePair({}, {} links)".format(self.id, len(self.source))
+
+
+class AlignedCorpus:
+    """
+    Europarl sentence pairs with word alignments, held in contiguous arrays
+    that are memory-mapped from a binary cache next to the text file, in
+    `<filename>.npcache`. The cache is rebuilt when the text file changes.
+
+    Two formats are read: records of four lines (id, English, German and
+    1-based `i:j` alignments, where one cell can hold several targets as in
+    `12:11 12`), and tab separated lines with English, German and 0-based
+    `i-j` alignments, whose remaining columns are ignored. Alignments are
+    stored 0-based.
+
+    Attributes:
+        filename: the text file.
+        text: UTF-8 bytes of all tokens, without separators.
+        token_offsets: byte offsets of the tokens in text, one more than the
+            number of tokens.
+        english: per sentence the index of its first English token, and one
+            more, the German tokens of a sentence directly follow the English.
+        german: per sentence the index of its first German token.
+        alignment_offsets: per sentence the index of its first link, and one
+            more.
+        source: English positions of all links.
+        target: German positions of all links.
+        ids: sentence ids.
+        order: positions of the sentences sorted by id.
+    """
+    def __init__(self, filename : str, cache : bool=True):
+        self.filename = filename
+        arrays = load_cache(filename, filename + ".npcache") if cache else None
+        if arrays is None:
+            arrays = build_arrays(read_records(filename))
+            if cache:
+                save_cache(filename, filename + ".npcache", arrays)
+        for name, values in arrays.items():
+            setattr(self, name, values)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, position : int) -> SentencePair:
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("Sentence position out of range.")
+        return SentencePair(self, position)
+
+    def __iter__(self) -> Iterator[SentencePair]:
+        return (SentencePair(self, p) for p in range(len(self)))
+
+    def position(self, sentence_id : int) -> int:
+        """Position of the sentence with the given id, through a binary
+        search in the sorted ids."""
+        i = np.searchsorted(self.ids, sentence_id, sorter=self.order)
+        if i == len(self) or self.ids[self.order[i]] != sentence_id:
+            raise KeyError(sentence_id)
+        return int(self.order[i])
+
+    def get_by_id(self, sentence_id : int) -> SentencePair:
+        return SentencePair(self, self.position(sentence_id))
+
+    def tokens(self, position : int, side : str="english") -> List[str]:
+        """Decode the English or German tokens of a sentence."""
+        first = self.english if side == "english" else self.german
+        last = self.german if side == "english" else self.english[1:]
+        start, end = first[position], last[position]
+        offsets = self.token_offsets[start:end + 1]
+        text = self.text[offsets[0]:offsets[-1]].tobytes()
+        offsets = offsets - offsets[0]
+        return [text[offsets[k]:offsets[k + 1]].decode("utf-8") for k in range(end - start)]
+
+
+def load_cache(filename : str, cache : str) -> Dict[str, np.ndarray]:
+    """Memory-map the arrays from a cache file if it was built from the
+    current version of the file."""
+    stat = os.stat(filename)
+    try:
+        with open(cache, "rb") as f:
+            if f.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+                return None
+            length = int(np.frombuffer(f.read(8), dtype=np.int64)[0])
+            header = json.loads(f.read(length).decode("utf-8"))
+        if header["version"] != CACHE_VERSION or \
+           header["source"] != [stat.st_size, stat.st_mtime_ns]:
+            return None
+        data = np.memmap(cache, dtype=np.uint8, mode="r")
+    except (OSError, ValueError, KeyError, IndexError):
+        return None
+
+    arrays = {}
+    for name, (dtype, size, offset) in header["arrays"].items():
+        dtype = np.dtype(dtype)
+        arrays[name] = data[offset:offset + size * dtype.itemsize].view(dtype)
+    return arrays
+
+
+def save_cache(filename : str, cache : str, arrays : Dict[str, np.ndarray]):
+    """Write arrays to a cache file, aligned to 64 bytes, after a header
+    describing them and the file they were built from."""
+    stat = os.stat(filename)
+    relative, size = {}, 0
+    for name, values in arrays.items():
+        relative[name] = size
+        size += -(-values.nbytes // ALIGNMENT) * ALIGNMENT
+    # The header holds the array offsets, so grow its space until it fits
+    start = 0
+    while True:
+        header = {"version": CACHE_VERSION, "source": [stat.st_size, stat.st_mtime_ns],
+                  "arrays": {name: [values.dtype.str, len(values), start + relative[name]]
+                             for name, values in arrays.items()}}
+        encoded = json.dumps(header).encode("utf-8")
+        if len(CACHE_MAGIC) + 8 + len(encoded) <= start: break
+        start = -(-(len(CACHE_MAGIC) + 8 + len(encoded)) // ALIGNMENT) * ALIGNMENT
+
+    temporary = cache + ".tmp"
+    try:
+        with open(temporary, "wb") as f:
+            f.write(CACHE_MAGIC)
+            f.write(np.int64(len(encoded)).tobytes())
+            f.write(encoded)
+            for name, values in arrays.items():
+                f.seek(header["arrays"][name][2])
+                f.write(values.tobytes())
+            f.truncate(start + size)
+        os.replace(temporary, cache)
+    except OSError:
+        logging.warning("Could not write the cache for {}.".format(filename))
+
+
+def read_records(filename : str) -> Iterator[Tuple[int, List[str], List[str], List[Tuple[int, int]]]]:
+    """Read (id, English tokens, German tokens, 0-based links) per sentence
+    pair, from either of the two alignment formats."""
+    with open(filename, encoding="utf-8") as f:
+        first = f.readline()
+        f.seek(0)
+        if "\t" in first.rstrip("\n"):
+            for number, line in enumerate(f):
+                columns = line.rstrip("\n").split("\t")
+                if len(columns) < 3: continue
+                links = []
+                for cell in columns[2].split():
+                    # Unaligned German tokens are written as -1-j
+                    i, _, j = cell.rpartition("-")
+                    links.append((int(i), int(j)))
+                yield number, columns[0].split(), columns[1].split(), links
+        else:
+            lines = (line.rstrip("\n") for line in f)
+            for sentence_id in lines:
+                if not sentence_id: continue
+                english, german, cells = next(lines), next(lines), next(lines)
+                links = []
+                for cell in cells.split("\t"):
+                    if not cell: continue
+                    i, _, targets = cell.partition(":")
+                    links.extend((int(i) - 1, int(j) - 1) for j in targets.split())
+                yield int(sentence_id), english.split(), german.split(), links
+
+
+def build_arrays(records : Iterator) -> Dict[str, np.ndarray]:
+    """Pack the sentence pairs into the arrays of an AlignedCorpus."""
+    text = bytearray()
+    token_offsets = array("q", [0])
+    english, german = array("q"), array("q")
+    alignment_offsets = array("q", [0])
+    source, target = array("i"), array("i")
+    ids = array("q")
+
+    for sentence_id, english_tokens, german_tokens, links in records:
+        ids.append(sentence_id)
+        english.append(len(token_offsets) - 1)
+        german.append(len(token_offsets) - 1 + len(english_tokens))
+        for token in english_tokens + german_tokens:
+            text += token.encode("utf-8")
+            token_offsets.append(len(text))
+        for i, j in links:
+            source.append(i)
+            target.append(j)
+        alignment_offsets.append(len(source))
+    english.append(len(token_offsets) - 1)
+
+    ids = np.frombuffer(ids, dtype=np.int64)
+    return {
+        "text": np.frombuffer(bytes(text), dtype=np.uint8),
+        "token_offsets": np.frombuffer(token_offsets, dtype=np.int64),
+        "english": np.frombuffer(english, dtype=np.int64),
+        "german": np.frombuffer(german, dtype=np.int64),
+        "alignment_offsets": np.frombuffer(alignment_offsets, dtype=np.int64),
+        "source": np.frombuffer(source, dtype=np.int32),
+        "target": np.frombuffer(target, dtype=np.int32),
+        "ids": ids,
+        "order": np.argsort(ids, kind="stable")
+    }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str, default="../../data/europarl_aligned/europarl_alignment.txt")
+    parser.add_argument('--id', type=int, default=None, help="Print the sentence pair with this id.")
+    parser.add_argument('--log_level', type=str, default="info")
+    args = vars(parser.parse_args())
+    logging.basicConfig(level=args["log_level"].upper(),
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if not os.path.isfile(args["data"]):
+        logging.error("Please enter an existing alignment file.")
+    else:
+        corpus = AlignedCorpus(args["data"])
+        logging.info("Loaded {} sentence pairs, {} tokens and {} alignment links.".format(
+            len(corpus), len(corpus.token_offsets) - 1, len(corpus.source)))
+        if args["id"] is not None:
+            pair = corpus.get_by_id(args["id"])
+            print(" ".join(pair.english))
+            print(" ".join(pair.german))
+            print(" ".join("{}-{}".format(i, j) for i, j in pair.links))
@@ -0,0 +1,198 @@
+import argparse
+import logging
+import os
+
+import numpy as np
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Tuple
+
+from alignments import AlignedCorpus
+
+
+class TokenAutomaton:
+    """
+    Aho-Corasick automaton over tokens, that finds all occurrences of a list of
+    multi-word patterns in a sequence in one pass, whatever the number of
+    patterns. States are numbered, state 0 is the root.
+
+    Attributes:
+        patterns: the patterns as tuples of tokens.
+        lowercase: whether patterns and sequences are matched lowercased.
+        transitions: per state, a dictionary from token to next state.
+        fail: per state, the state of its longest proper suffix in the trie.
+        outputs: per state, the ids of the patterns ending in it.
+    """
+    def __init__(self, patterns : Iterable[str], lowercase : bool=True):
+        self.lowercase = lowercase
+        self.patterns = []
+        self.transitions = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+        for pattern in patterns:
+            self.add(pattern)
+        self._link()
+
+    def add(self, pattern : str):
+        """Add a pattern to the trie. Call _link before searching."""
+        tokens = tuple((pattern.lower() if self.lowercase else pattern).split())
+        if not tokens: return
+        state = 0
+        for token in tokens:
+            if token not in self.transitions[state]:
+                self.transitions.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+                self.transitions[state][token] = len(self.transitions) - 1
+            state = self.transitions[state][token]
+        self.outputs[state].append(len(self.patterns))
+        self.patterns.append(tokens)
+
+    def _link(self):
+        """Compute the failure links breadth first, and merge the outputs of
+        the failure state into every state."""
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, child in self.transitions[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and token not in self.transitions[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.transitions[fallback].get(token, 0)
+                if self.fail[child] == child: self.fail[child] = 0
+                self.outputs[child] = self.outputs[child] + self.outputs[self.fail[child]]
+
+    def search(self, tokens : List[str]) -> Iterator[Tuple[int, int, int]]:
+        """Yield (start, end, pattern id) for every occurrence of a pattern in
+        the tokens, ordered by end position."""
+        state = 0
+        transitions, fail, outputs = self.transitions, self.fail, self.outputs
+        for position, token in enumerate(tokens):
+            if self.lowercase: token = token.lower()
+            while state and token not in transitions[state]:
+                state = fail[state]
+            state = transitions[state].get(token, 0)
+            for pattern in outputs[state]:
+                yield position + 1 - len(self.patterns[pattern]), position + 1, pattern
+
+
+class Occurrence:
+    """
+    Occurrence of a compound in the English side of a sentence pair, with the
+    German tokens aligned to it.
+
+    Attributes:
+        compound: the compound.
+        sentence: id of the sentence pair.
+        start: position of the first token of the occurrence.
+        end: position after the last token of the occurrence.
+        german: ascending German positions aligned to the occurrence.
+        translation: the German tokens at those positions.
+    """
+    __slots__ = ("compound", "sentence", "start", "end", "german", "translation")
+
+    def __init__(self, compound : str, sentence : int, start : int, end : int,
+                 german : List[int], translation : List[str]):
+        self.compound = compound
+        self.sentence = sentence
+        self.start = start
+        self.end = end
+        self.german = german
+        self.translation = translation
+
+    def __str__(self):
+        return "{}\t{}\t{}\t{}\t{}\t{}".format(self.compound, self.sentence, self.start, self.end,
+                                               " ".join(map(str, self.german)), " ".join(self.translation))
+
+
+def find_compounds(corpus : AlignedCorpus, automaton : TokenAutomaton,
+                   positions : Iterable[int]=None) -> Iterator[Occurrence]:
+    """Find the compounds in the English sentences at the given positions, by
+    default all, and join every occurrence with its alignment."""
+    for position in (range(len(corpus)) if positions is None else positions):
+        pair = corpus[position]
+        german = None
+        for start, end, pattern in automaton.search(pair.english):
+            if german is None: german = pair.german
+            targets = np.unique(pair.target[(pair.source >= start) & (pair.source < end)]).tolist()
+            yield Occurrence(" ".join(automaton.patterns[pattern]), pair.id, start, end,
+                             targets, [german[j] for j in targets])
+
+
+def find_compounds_parallel(filename : str, automaton : TokenAutomaton, workers : int,
+                            shard_size : int=1000) -> Iterator[Occurrence]:
+    """Find the compounds in shards of sentences in worker processes, which
+    memory-map the corpus from its cache. Occurrences are returned in the
+    order of the corpus, and at most two shards per worker are in flight."""
+    n = len(AlignedCorpus(filename))
+    shards = (range(start, min(start + shard_size, n)) for start in range(0, n, shard_size))
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(filename, automaton)) as executor:
+        pending = deque()
+        for shard in shards:
+            pending.append(executor.submit(_find_shard, shard))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+# Corpus and automaton used by the search in worker processes
+_worker_corpus = None
+_worker_automaton = None
+
+
+def _init_worker(filename : str, automaton : TokenAutomaton):
+    global _worker_corpus, _worker_automaton
+    _worker_corpus = AlignedCorpus(filename)
+    _worker_automaton = automaton
+
+
+def _find_shard(positions : range) -> List[Occurrence]:
+    return list(find_compounds(_worker_corpus, _worker_automaton, positions))
+
+
+def read_compounds(filenames : List[str]) -> List[str]:
+    """Read the compounds of one or more lists, one compound per line."""
+    compounds = []
+    for filename in filenames:
+        with open(filename, encoding="utf-8") as f:
+            compounds.extend(line.strip() for line in f if line.strip())
+    return compounds
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str, default="../../data/europarl_aligned/europarl_alignment.txt")
+    parser.add_argument('--compounds', type=str, nargs="+",
+                        default=["../../data/compoundlists/farahmand.txt", "../../data/compoundlists/reddy.txt"])
+    parser.add_argument('--output', type=str, default="compounds.tsv")
+    parser.add_argument('--case_sensitive', action="store_true")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of processes used to search the corpus.")
+    parser.add_argument('--log_level', type=str, default="info")
+    args = vars(parser.parse_args())
+    logging.basicConfig(level=args["log_level"].upper(),
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if not os.path.isfile(args["data"]):
+        logging.error("Please enter an existing alignment file.")
+    elif not all(os.path.isfile(f) for f in args["compounds"]):
+        logging.error("Please enter existing compound lists.")
+    else:
+        automaton = TokenAutomaton(read_compounds(args["compounds"]), lowercase=not args["case_sensitive"])
+        logging.info("Compiled {} compounds into {} states.".format(
+            len(automaton.patterns), len(automaton.transitions)))
+        if args["workers"] > 1:
+            occurrences = find_compounds_parallel(args["data"], automaton, args["workers"])
+        else:
+            occurrences = find_compounds(AlignedCorpus(args["data"]), automaton)
+
+        n = 0
+        with open(args["output"], "w", encoding="utf-8") as f:
+            for occurrence in occurrences:
+                f.write("{}\n".format(occurrence))
+                n += 1
+        logging.info("Found {} occurrences.".format(n))
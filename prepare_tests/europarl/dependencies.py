@@ -0,0 +1,159 @@
+import argparse
+import logging
+import os
+import re
+
+import numpy as np
+
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+from alignments import AlignedCorpus, load_cache, save_cache
+
+
+# An edge such as nsubj(give-3, I-1), tokens are numbered from 1 and copied
+# tokens in enhanced parses carry primes, as in give-3'
+EDGE = re.compile(r"([^(]+)\((.*)-(\d+)'*, (.*)-(\d+)'*\)$")
+
+
+class DependencyGraphs:
+    """
+    Dependency parses of the English sentences in the fourth column of the
+    deps file, stored as columns of edges: a relation id, head and dependent
+    per edge, and per sentence the index of its first edge. Positions are
+    0-based, the head of the root edge is -1. The columns are memory-mapped
+    from a cache next to the file, in `<filename>.deps.npcache`.
+
+    Attributes:
+        filename: the deps file.
+        relations: relation names, indexed by relation id.
+        relation: relation id per edge.
+        head: English position of the head per edge.
+        dependent: English position of the dependent per edge.
+        offsets: per sentence the index of its first edge, and one more.
+        sentence: sentence position per edge.
+    """
+    def __init__(self, filename : str, cache : bool=True):
+        self.filename = filename
+        arrays = load_cache(filename, filename + ".deps.npcache") if cache else None
+        if arrays is None:
+            arrays = build_edges(read_parses(filename))
+            if cache:
+                save_cache(filename, filename + ".deps.npcache", arrays)
+        self.relations = arrays["relations"].tobytes().decode("utf-8").split("\n")
+        self._ids = {r: i for i, r in enumerate(self.relations)}
+        self.relation = arrays["relation"]
+        self.head = arrays["head"]
+        self.dependent = arrays["dependent"]
+        self.offsets = arrays["offsets"]
+        self.sentence = np.repeat(np.arange(len(self.offsets) - 1), np.diff(self.offsets))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def edges(self, position : int) -> List[Tuple[str, int, int]]:
+        """(relation, head, dependent) per edge of a sentence."""
+        start, end = self.offsets[position:position + 2]
+        return [(self.relations[r], h, d) for r, h, d in zip(
+            self.relation[start:end].tolist(), self.head[start:end].tolist(),
+            self.dependent[start:end].tolist())]
+
+    def with_relations(self, relations : Iterable[str]) -> np.ndarray:
+        """Boolean array marking the edges with one of the relations. Unknown
+        relations match no edges."""
+        ids = [self._ids[r] for r in relations if r in self._ids]
+        return np.isin(self.relation, ids)
+
+    def statistics(self) -> Counter:
+        """Number of edges per relation."""
+        counts = np.bincount(self.relation, minlength=len(self.relations))
+        return Counter(dict(zip(self.relations, counts.tolist())))
+
+    def single_target(self, corpus : AlignedCorpus) -> np.ndarray:
+        """Boolean array marking the edges whose head and dependent are both
+        aligned to exactly one German token, the same for both. The corpus
+        holds the alignments of the same file."""
+        if len(corpus) != len(self):
+            raise ValueError("The corpus and the parses have a different number of sentences.")
+        # Number of links and the last target of every English token, over
+        # the token numbering of the corpus
+        n_tokens = len(corpus.token_offsets) - 1
+        links = np.repeat(np.arange(len(corpus)), np.diff(corpus.alignment_offsets))
+        aligned = corpus.source >= 0
+        tokens = corpus.english[links[aligned]] + corpus.source[aligned]
+        counts = np.bincount(tokens, minlength=n_tokens)
+        targets = np.full(n_tokens, -1, dtype=np.int64)
+        targets[tokens] = corpus.target[aligned]
+
+        mask = self.head >= 0
+        first = corpus.english[self.sentence]
+        head = first + np.where(mask, self.head, 0)
+        dependent = first + self.dependent
+        return mask & (counts[head] == 1) & (counts[dependent] == 1) & \
+            (targets[head] == targets[dependent])
+
+
+def read_parses(filename : str) -> Iterable[List[Tuple[str, int, int]]]:
+    """Read the (relation, 0-based head, 0-based dependent) edges of every line
+    of a deps file."""
+    with open(filename, encoding="utf-8") as f:
+        for line in f:
+            columns = line.rstrip("\n").split("\t")
+            if len(columns) < 3: continue
+            edges = []
+            for edge in (columns[3].split("*") if len(columns) > 3 and columns[3] else []):
+                match = EDGE.match(edge)
+                if match is None:
+                    raise ValueError("Cannot parse the dependency edge '{}'.".format(edge))
+                edges.append((match.group(1), int(match.group(3)) - 1, int(match.group(5)) - 1))
+            yield edges
+
+
+def build_edges(parses : Iterable[List[Tuple[str, int, int]]]) -> Dict[str, np.ndarray]:
+    """Pack the edges of all sentences into the columns of DependencyGraphs."""
+    ids = {}
+    relation, head, dependent = array("h"), array("i"), array("i")
+    offsets = array("q", [0])
+    for edges in parses:
+        for name, h, d in edges:
+            relation.append(ids.setdefault(name, len(ids)))
+            head.append(h)
+            dependent.append(d)
+        offsets.append(len(relation))
+    return {
+        "relations": np.frombuffer("\n".join(ids).encode("utf-8"), dtype=np.uint8),
+        "relation": np.frombuffer(relation, dtype=np.int16),
+        "head": np.frombuffer(head, dtype=np.int32),
+        "dependent": np.frombuffer(dependent, dtype=np.int32),
+        "offsets": np.frombuffer(offsets, dtype=np.int64)
+    }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str, default="../../data/europarl_aligned/english-german-alignment-deps.txt")
+    parser.add_argument('--relations', type=str, nargs="+", default=["amod", "compound"])
+    parser.add_argument('--log_level', type=str, default="info")
+    args = vars(parser.parse_args())
+    logging.basicConfig(level=args["log_level"].upper(),
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if not os.path.isfile(args["data"]):
+        logging.error("Please enter an existing deps file.")
+    else:
+        corpus = AlignedCorpus(args["data"])
+        graphs = DependencyGraphs(args["data"])
+        logging.info("Loaded {} edges for {} sentences.".format(len(graphs.relation), len(graphs)))
+
+        # Print the edges of the relations that are translated as one word
+        selected = np.flatnonzero(graphs.with_relations(args["relations"]) & graphs.single_target(corpus))
+        logging.info("{} {} edges align to a single German token.".format(
+            len(selected), "/".join(args["relations"])))
+        for k in selected.tolist():
+            pair = corpus[graphs.sentence[k]]
+            english = pair.english
+            german = pair.german[pair.target[pair.source == graphs.head[k]][0]]
+            print("{}\t{} {}\t{}".format(graphs.relations[graphs.relation[k]],
+                                         english[graphs.dependent[k]], english[graphs.head[k]], german))
@@ -0,0 +1,51 @@
+import random
+
+from compounds import TokenAutomaton
+
+
+def brute_force(patterns, tokens, lowercase=True):
+    """All (start, end, pattern id) occurrences, ordered like search."""
+    if lowercase:
+        patterns = [p.lower() for p in patterns]
+        tokens = [t.lower() for t in tokens]
+    patterns = [tuple(p.split()) for p in patterns]
+    return sorted(((start, start + len(p), i) for i, p in enumerate(patterns)
+                   for start in range(len(tokens) - len(p) + 1)
+                   if tuple(tokens[start:start + len(p)]) == p),
+                  key=lambda match: (match[1], -len(patterns[match[2]]), match[2]))
+
+
+def matches(automaton, tokens):
+    return sorted(automaton.search(tokens),
+                  key=lambda match: (match[1], match[0] - match[1], match[2]))
+
+
+def test_overlapping_matches():
+    automaton = TokenAutomaton(["a b", "b c", "c d"])
+    assert matches(automaton, "a b c d".split()) == [(0, 2, 0), (1, 3, 1), (2, 4, 2)]
+
+
+def test_nested_matches():
+    automaton = TokenAutomaton(["human rights", "rights", "human rights council", "council"])
+    tokens = "the human rights council met".split()
+    assert matches(automaton, tokens) == [(1, 3, 0), (2, 3, 1), (1, 4, 2), (3, 4, 3)]
+
+
+def test_repeated_tokens():
+    automaton = TokenAutomaton(["a a", "a a a"])
+    assert matches(automaton, "a a a a".split()) == [
+        (0, 2, 0), (0, 3, 1), (1, 3, 0), (1, 4, 1), (2, 4, 0)]
+
+
+def test_lowercase():
+    assert list(TokenAutomaton(["Human Rights"]).search("HUMAN rights".split())) == [(0, 2, 0)]
+    assert list(TokenAutomaton(["Human Rights"], lowercase=False).search("HUMAN rights".split())) == []
+
+
+def test_matches_brute_force():
+    rng = random.Random(1)
+    for _ in range(200):
+        patterns = [" ".join(rng.choice("abc") for _ in range(rng.randint(1, 4)))
+                    for _ in range(rng.randint(1, 6))]
+        tokens = [rng.choice("abcd") for _ in range(rng.randint(0, 15))]
+        assert matches(TokenAutomaton(patterns), tokens) == brute_force(patterns, tokens)
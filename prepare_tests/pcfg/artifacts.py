@@ -0,0 +1,120 @@
+import os
+import json
+import fcntl
+import hashlib
+import logging
+
+from typing import Dict, List, Tuple
+
+
+class ArtifactCache:
+    """
+    Manifest of the test sets generated in an output directory, stored in
+    `<output_dir>/manifest.json'. Every stage is recorded with a key hashing
+    everything its outputs depend on: the contents of the input files, the
+    config section of the experiment, the general settings listed in the
+    `output_settings' of the handler class, the handler class, the random
+    seed and the stage itself. A stage is up to date if its key did not change and its
+    outputs were not changed or removed since they were recorded.
+
+    Attributes:
+        output_dir: directory the outputs are written to.
+        enabled: if False, no stage is ever up to date, but stages are still
+            recorded.
+        manifest: per stage its key and the size and modification time of its
+            outputs, and per input file its hash with its size and
+            modification time, to only hash files again when they changed.
+    """
+    def __init__(self, output_dir : str, enabled : bool=True):
+        self.output_dir = output_dir
+        self.enabled = enabled
+        self.filename = os.path.join(output_dir, "manifest.json")
+        self.manifest = self._read()
+
+    def _read(self) -> Dict:
+        try:
+            with open(self.filename) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"stages": {}, "files": {}}
+
+    def key(self, stage : str, inputs : List[str], config : Dict, handler : type,
+            seed : int=None, general : Dict=None) -> str:
+        """Hash the inputs and settings a stage depends on."""
+        general = general or {}
+        digest = hashlib.sha256()
+        digest.update(json.dumps({
+            "stage": stage,
+            "inputs": [self.file_hash(filename) for filename in inputs],
+            "config": config,
+            "general": {name: general.get(name, False) for name in handler.output_settings},
+            "handler": "{}.{}".format(handler.__module__, handler.__qualname__),
+            "seed": seed
+        }, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def file_hash(self, filename : str) -> str:
+        """Content hash of a file, reused while its size and modification
+        time are the same as when it was hashed."""
+        stat = os.stat(filename)
+        path = os.path.abspath(filename)
+        entry = self.manifest["files"].get(path)
+        if entry is not None and entry["stat"] == [stat.st_size, stat.st_mtime_ns]:
+            return entry["hash"]
+        digest = hashlib.blake2b()
+        with open(filename, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self.manifest["files"][path] = {"stat": [stat.st_size, stat.st_mtime_ns], "hash": digest.hexdigest()}
+        return digest.hexdigest()
+
+    def pending(self, stages : List[Tuple[str, List[str], List[str], int]], config : Dict,
+                handler : type, general : Dict=None) -> List[Tuple[str, str, List[str]]]:
+        """(stage, key, outputs) of the stages that are not up to date, out
+        of (stage, inputs, outputs, seed) per stage."""
+        pending = []
+        for stage, inputs, outputs, seed in stages:
+            key = self.key(stage, inputs, config, handler, seed, general)
+            if not self.up_to_date(stage, key, outputs):
+                pending.append((stage, key, outputs))
+        return pending
+
+    def up_to_date(self, stage : str, key : str, outputs : List[str]) -> bool:
+        entry = self.manifest["stages"].get(stage)
+        if not self.enabled or entry is None or entry["key"] != key:
+            return False
+        if sorted(entry["outputs"]) != sorted(outputs):
+            return False
+        for filename in outputs:
+            if not os.path.isfile(filename): return False
+            stat = os.stat(filename)
+            if entry["outputs"][filename] != [stat.st_size, stat.st_mtime_ns]:
+                return False
+        logging.info("Stage {} is up to date, skipping it.".format(stage))
+        return True
+
+    def record(self, stage : str, key : str, outputs : List[str]):
+        """Record that a stage wrote its outputs, and save the manifest. The
+        manifest on disk is read again under a lock and only this stage and
+        the file hashes are merged into it, so that processes sharing an
+        output directory keep each other's stages."""
+        stats = {filename: os.stat(filename) for filename in outputs}
+        entry = {
+            "key": key,
+            "outputs": {f: [s.st_size, s.st_mtime_ns] for f, s in stats.items()}
+        }
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(self.filename + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            manifest = self._read()
+            manifest["stages"][stage] = entry
+            manifest["files"].update(self.manifest["files"])
+            self.manifest = manifest
+            self.save()
+
+    def save(self):
+        """Write the manifest atomically. Call it while holding the lock."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(self.filename + ".tmp", "w") as f:
+            json.dump(self.manifest, f, indent=4)
+        os.replace(self.filename + ".tmp", self.filename)
@@ -0,0 +1,172 @@
+import argparse
+import logging
+import os
+import sys
+import json
+import time
+import random
+import platform
+import tempfile
+import tracemalloc
+
+from typing import Callable, Dict, List
+
+import handlers
+import localism
+import exceptions
+from dataset import Dataset
+
+
+logger = logging.getLogger("benchmark")
+
+# Letters as used in the PCFG dataset
+LETTERS = ["{}{}".format(c, i) for c in "ABCDEFGHIJKLMNOPQRSTUVWXYZ" for i in range(1, 21)]
+
+
+def generate_corpus(handler : handlers.PCFGHandler, filename : str, n : int,
+                    depth : int, rng : random.Random, batch_size : int=10000):
+    """Write n random PCFG samples with function calls nested at most `depth'
+    deep, with arguments of two to five letters as in `construct_primitives'."""
+
+    def get_source(level : int, top : bool=False) -> str:
+        if level == 0 or (not top and rng.random() < 0.3):
+            return " ".join(rng.choice(handler.letters) for _ in range(rng.randint(2, 5)))
+        function = rng.choice(handler.functions)
+        if function in handler.binary:
+            return "{} {} , {}".format(function, get_source(level - 1), get_source(level - 1))
+        return "{} {}".format(function, get_source(level - 1))
+
+    with open(filename, "w") as f:
+        for start in range(0, n, batch_size):
+            sources = [get_source(depth, True) for _ in range(min(batch_size, n - start))]
+            targets = handler.get_targets(sources)
+            for source, target in zip(sources, targets):
+                f.write("{}\t{}\n".format(source, " ".join(target)))
+
+
+def measure(stage : Callable[[], None]) -> Dict[str, float]:
+    """Run a stage twice: once to time it and once to trace its peak memory
+    use, since tracing slows Python code down."""
+    start = time.perf_counter()
+    stage()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    stage()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": seconds, "peak_bytes": peak}
+
+
+def benchmark(config : Dict[str, Dict], size : int, depth : int, seed : int,
+              directory : str) -> Dict[str, Dict[str, float]]:
+    """Generate a corpus of `size' training samples and a tenth of that for
+    testing, and benchmark all stages of test generation on it."""
+    train = os.path.join(directory, "train_{}.tsv".format(size))
+    test = os.path.join(directory, "test_{}.tsv".format(size))
+    output_dir = os.path.join(directory, "experiments")
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Bootstrap a handler that knows all letters to compute the targets
+    letters = os.path.join(directory, "letters.tsv")
+    with open(letters, "w") as f:
+        f.write("{}\t-\n".format(" ".join(LETTERS)))
+    config["general"].update({"train": letters, "test": letters, "output_dir": output_dir})
+    handler = handlers.PCFGHandler(config, "localism")
+    rng = random.Random(seed)
+    generate_corpus(handler, train, size, depth, rng)
+    generate_corpus(handler, test, max(1, size // 10), depth, rng)
+
+    config["general"].update({"train": train, "test": test})
+    handler_localism = handlers.PCFGHandler(config, "localism")
+    handler_exceptions = handlers.PCFGHandler(config, "exceptions")
+    dataset = Dataset(filename=train)
+
+    def stage(function : Callable[[], None]) -> Callable[[], None]:
+        # Every run of a stage starts with empty caches
+        def run():
+            for handler in (handler_localism, handler_exceptions):
+                handler.parses.clear()
+                handler.cache.clear()
+            function()
+        return run
+
+    stages = {
+        "Dataset.load": lambda: Dataset(filename=train),
+        "Dataset.save": lambda: dataset.save("saved.tsv", output_dir),
+        "_place_brackets": lambda: [handler_localism._place_brackets(s.source) for s in dataset],
+        "unroll": lambda: [handler_localism.unroll(s) for s in dataset],
+        "get_target": lambda: [handler_localism.get_target(s.source, None, None) for s in dataset],
+        "localism": lambda: localism.localism(handler_localism, handler_localism.train, "train"),
+        "exceptions": lambda: exceptions.exceptions(
+            handler_exceptions, handler_exceptions.train, handler_exceptions.test),
+    }
+    results = {}
+    for name, function in stages.items():
+        results[name] = measure(stage(function))
+        results[name]["samples_per_second"] = size / max(results[name]["seconds"], 1e-9)
+        logger.info("{} samples, {}: {:.3f}s, peak {:.1f} MiB".format(
+            size, name, results[name]["seconds"], results[name]["peak_bytes"] / 2 ** 20))
+    return results
+
+
+def compare(results : Dict, baseline : Dict, tolerance : float) -> List[str]:
+    """List the stages whose time or peak memory grew by more than a factor
+    `tolerance' compared to the baseline."""
+    regressions = []
+    for size, stages in results["results"].items():
+        for name, result in stages.items():
+            previous = baseline["results"].get(size, {}).get(name)
+            if previous is None: continue
+            for key in ("seconds", "peak_bytes"):
+                if previous[key] > 0 and result[key] / previous[key] > tolerance:
+                    regressions.append("{} samples, {}: {} {:.4g} -> {:.4g}".format(
+                        size, name, key, previous[key], result[key]))
+    return regressions
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', type=str, default="config.json")
+    parser.add_argument('--log_level', type=str, default="info")
+    parser.add_argument('--sizes', type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument('--depth', type=int, default=5,
+                        help="Maximum nesting depth of generated samples.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--directory', type=str, default=None,
+                        help="Directory for generated data, temporary by default.")
+    parser.add_argument('--output', type=str, default="benchmark.json")
+    parser.add_argument('--baseline', type=str, default=None,
+                        help="Results of an earlier run to compare against.")
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help="Factor by which a stage may get slower or bigger.")
+    args = vars(parser.parse_args())
+    logging.basicConfig(level=args["log_level"].upper(),
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    with open(args["config"]) as f: config = json.load(f)
+    # Only log progress of the benchmark, not of the test generation itself
+    logger.setLevel(args["log_level"].upper())
+    logging.getLogger().setLevel(max(logging.WARNING, logging.getLogger().level))
+
+    results = {
+        "python": platform.python_version(),
+        "depth": args["depth"],
+        "seed": args["seed"],
+        "results": {}
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        directory = args["directory"] or directory
+        for size in args["sizes"]:
+            results["results"][str(size)] = benchmark(
+                config, size, args["depth"], args["seed"], directory)
+    with open(args["output"], "w") as f:
+        json.dump(results, f, indent=4)
+
+    if args["baseline"] is not None:
+        with open(args["baseline"]) as f: baseline = json.load(f)
+        regressions = compare(results, baseline, args["tolerance"])
+        for regression in regressions:
+            print("Regression: {}".format(regression))
+        if regressions:
+            sys.exit(1)
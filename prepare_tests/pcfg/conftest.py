@@ -0,0 +1,15 @@
+import pytest
+
+from dataset import save_samples
+
+
+def pairs(samples):
+    return [(s.source, s.target) for s in samples]
+
+
+@pytest.fixture
+def tsv(request, tmp_path):
+    """The SAMPLES of the test module, saved to a tab separated file."""
+    filename = str(tmp_path / "data.tsv")
+    save_samples(request.module.SAMPLES, filename)
+    return filename
@@ -1,73 +1,143 @@
 import os
+import gzip
+import mmap
 import random
+import hashlib
+import zipfile
 
+import numpy as np
+
+from array import array
 from collections import Counter
+from typing import Dict, Iterable, List
+from writer import SampleWriter, _fsync_directory
+from sampling import reservoir
 
 
 class Dataset:
-    def __init__(self, filename : str=None, samples : list=None):
-        self.samples = []
+    def __init__(self, filename : str=None, samples : list=None, cache : bool=False):
+        self._samples = []
+        self._index = {}
+        self._removed = 0
         self.statistics = Counter()
         if filename is not None:
-            self.load(filename)
+            self.load(filename, cache)
         if samples is not None:
-            self.samples.extend(samples)
-        for s in self.samples:
-            self._update_statistics(s)
+            self.extend(samples)
+
+    @property
+    def samples(self) -> list:
+        self._compact()
+        return self._samples
 
-    def load(self, filename : str):
+    @samples.setter
+    def samples(self, samples : list):
+        self._samples = []
+        self._index = {}
+        self._removed = 0
+        self.statistics = Counter()
+        self.extend(samples)
+
+    def load(self, filename : str, cache : bool=False):
         """Load a dataset with source and target separated by a tab into a list of
-        dictionaries with keys "source" and "target"."""
-        with open(filename) as f:
-            for line in f:
-                line = line.strip()
-                # Assume source and target are separated by a tab
-                [sequence, target] = line.split("\t")
-                self.samples.append(Sample(sequence, target))
+        dictionaries with keys "source" and "target". Files ending with .gz
+        are decompressed, files ending with .npz are read in the binary
+        format, and with cache=True other files are read from a binary copy
+        cached next to them. The binary format keeps the exact text of the
+        samples, so both give the same samples."""
+        if filename.endswith(".npz"):
+            self._load_arrays(load_binary(filename))
+        elif cache:
+            self._load_arrays(load_cached_binary(filename))
+        else:
+            with open_text(filename) as f:
+                for line in f:
+                    self.add(read_sample(line))
 
     def save(self, filename : str, folder : str=""):
-        """Save a dataset with source and target separated by a tab per line."""
-        if folder:
-            if not os.path.exists(folder):
-                os.mkdir(folder)
-            filename = os.path.join(folder, filename)
-
-        with open(filename, 'w') as f:
-            for sample in self.samples:
-                f.write("{}\t{}\n".format(sample.source, sample.target))
+        """Save a dataset with source and target separated by a tab per line,
+        or in the binary format if the filename ends with .npz."""
+        save_samples(self, filename, folder)
 
     def add(self, sample):
-        self.samples.append(sample)
+        self._index.setdefault(sample.source, []).append(len(self._samples))
+        self._samples.append(sample)
         self._update_statistics(sample)
 
     def remove(self, samples):
+        """Remove samples from the dataset. If a sample object is not part of
+        the dataset, the first sample with the same source is removed."""
         for sample in samples:
-            if sample in self.samples:
-                self.samples.remove(sample)
-            else:
-                for sample2 in self.samples:
-                    if sample2.source == sample.source:
-                        self.samples.remove(sample2)
-                        break
+            positions = self._index.get(sample.source)
+            if positions is None:
+                continue
+            position = next(
+                (p for p in positions if self._samples[p] is sample), positions[0]
+            )
+            positions.remove(position)
+            if not positions:
+                del self._index[sample.source]
+            # Leave a hole, the list is compacted on the next positional access
+            self._samples[position] = None
+            self._removed += 1
             for token in set(sample.source.split()):
                 self.statistics[token] -= 1
 
     def extend(self, samples):
-        self.samples.extend(samples)
         for s in samples:
-            self._update_statistics(s)
+            self.add(s)
 
-    def keep_top(self, n):
-        self.samples = random.sample(self.samples, min([n, len(self.samples)]))
-        self.statistics = Counter()
-        for s in self.samples:
-            self._update_statistics(s)
+    def get_by_source(self, source : str) -> list:
+        """Return all samples with the given source sequence."""
+        return [self._samples[p] for p in self._index.get(source, [])]
+
+    def keep_top(self, n, seed : int=None):
+        """Keep a random subset of n samples, sampled in one pass over their
+        positions. Without a seed, the seed is drawn from `random'."""
+        samples = self.samples
+        self.samples = [samples[p] for p in reservoir(range(len(samples)), n, _seed(seed))]
+
+    def select(self, positions : Iterable[int]):
+        """A view of the samples at the given positions, without copying."""
+        return DatasetView(self, positions)
+
+    def filter(self, predicate):
+        """A view of the samples for which the predicate holds."""
+        return DatasetView(self, [p for p, s in enumerate(self) if predicate(s)])
+
+    def _load_arrays(self, arrays : Dict[str, np.ndarray]):
+        tokens = decode_vocabulary(arrays["vocabulary"])
+        sources = decode_sequences(tokens, arrays["source_ids"], arrays["source_offsets"])
+        targets = decode_sequences(tokens, arrays["target_ids"], arrays["target_offsets"])
+        # Samples whose whitespace the token ids do not keep are stored as text
+        for position, sample in decode_exact(arrays).items():
+            sources[position], targets[position] = sample.source, sample.target
+        for source, target in zip(sources, targets):
+            self._index.setdefault(source, []).append(len(self._samples))
+            self._samples.append(Sample(source, target))
+        self.statistics.update({t: c for t, c in zip(tokens, arrays["counts"].tolist()) if c})
+
+    def _compact(self):
+        if not self._removed:
+            return
+        self._samples = [s for s in self._samples if s is not None]
+        self._removed = 0
+        self._index = {}
+        for i, s in enumerate(self._samples):
+            self._index.setdefault(s.source, []).append(i)
 
     def _update_statistics(self, sample):
         self.statistics.update(set(sample.source.split()))
 
     def __len__(self):
-        return len(self.samples)
+        return len(self._samples) - self._removed
+
+    def __contains__(self, sample):
+        source = sample.source if isinstance(sample, Sample) else sample
+        return source in self._index
+
+    def __iter__(self):
+        return (s for s in self._samples if s is not None)
 
     def __getitem__(self, i):
         return self.samples[i]
@@ -76,10 +146,610 @@ class Dataset:
         return "\n".join([str(s) for s in self.samples])
 
 
+class LazyDataset(Dataset):
+    """
+    Read-only dataset that memory-maps a tab separated file and only creates
+    samples when they are accessed. The start offsets of the lines are cached
+    next to the file in `<filename>.offsets`, and rebuilt when the file changes
+    or the cache is incomplete.
+    Use Dataset(samples=lazy_dataset) to load the samples into memory.
+    """
+    def __init__(self, filename : str):
+        self.filename = filename
+        self._file = open(filename, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) \
+            if size > 0 else b""
+        self._offsets = self._load_offsets()
+        self._statistics = None
+
+    @property
+    def statistics(self) -> Counter:
+        """Number of samples containing every token, computed on first use."""
+        if self._statistics is None:
+            self._statistics = Counter()
+            for s in self:
+                self._update_statistics(s)
+        return self._statistics
+
+    @property
+    def samples(self) -> list:
+        return list(self)
+
+    def load(self, filename : str, cache : bool=False):
+        raise TypeError("A LazyDataset cannot load additional files.")
+
+    def add(self, sample):
+        raise TypeError("A LazyDataset is read-only.")
+
+    def remove(self, samples):
+        raise TypeError("A LazyDataset is read-only.")
+
+    def extend(self, samples):
+        raise TypeError("A LazyDataset is read-only.")
+
+    def get_by_source(self, source : str) -> list:
+        """Return all samples with the given source, by scanning the file."""
+        return [s for s in self if s.source == source]
+
+    def keep_top(self, n, seed : int=None):
+        """Keep a random subset of n lines, without reading the other lines."""
+        self._offsets = array("q", reservoir(self._offsets, n, _seed(seed)))
+        self._statistics = None
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def _load_offsets(self) -> array:
+        """Read the line offsets from the cache if it is up to date and
+        complete, otherwise scan the file for newlines and try to store the
+        offsets. The cache starts with the size and modification time of the
+        file and the number of offsets."""
+        stat = os.fstat(self._file.fileno())
+        header = array("q", [stat.st_size, stat.st_mtime_ns])
+        cache = self.filename + ".offsets"
+        try:
+            with open(cache, "rb") as f:
+                offsets = array("q")
+                offsets.frombytes(f.read())
+            # Only empty files have no lines, and every line starts in the file
+            if offsets[:2] == header and len(offsets) > 2 and offsets[2] == len(offsets) - 3 \
+                    and (offsets[-1] < stat.st_size if len(offsets) > 3 else stat.st_size == 0):
+                return offsets[3:]
+        except (OSError, ValueError):
+            pass
+
+        offsets = array("q")
+        position = 0
+        while position < len(self._map):
+            offsets.append(position)
+            end = self._map.find(b"\n", position)
+            if end == -1:
+                break
+            position = end + 1
+
+        # Readers never see a partly written cache
+        temporary = cache + ".tmp"
+        try:
+            with open(temporary, "wb") as f:
+                (header + array("q", [len(offsets)]) + offsets).tofile(f)
+            os.replace(temporary, cache)
+        except OSError:
+            pass
+        return offsets
+
+    def _read(self, offset : int):
+        end = self._map.find(b"\n", offset)
+        if end == -1:
+            end = len(self._map)
+        return read_sample(self._map[offset:end].decode("utf-8"))
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __contains__(self, sample):
+        source = sample.source if isinstance(sample, Sample) else sample
+        return any(s.source == source for s in self)
+
+    def __iter__(self):
+        return (self._read(offset) for offset in self._offsets)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._read(offset) for offset in self._offsets[i]]
+        return self._read(self._offsets[i])
+
+
+class Vocabulary:
+    """Mapping between tokens and integer ids, shared between datasets."""
+    def __init__(self):
+        self.tokens = []
+        self.ids = {}
+
+    def encode(self, tokens : List[str]) -> array:
+        """Convert tokens to ids, adding unknown tokens to the vocabulary."""
+        ids = array("i")
+        for token in tokens:
+            i = self.ids.get(token)
+            if i is None:
+                i = self.ids[token] = len(self.tokens)
+                self.tokens.append(token)
+            ids.append(i)
+        return ids
+
+    def lookup(self, tokens : List[str]) -> array:
+        """Convert tokens to ids, or return None if a token is unknown."""
+        try:
+            return array("i", [self.ids[token] for token in tokens])
+        except KeyError:
+            return None
+
+    def decode(self, ids : array) -> List[str]:
+        return [self.tokens[i] for i in ids]
+
+    def __len__(self):
+        return len(self.tokens)
+
+
+class CompactDataset(Dataset):
+    """
+    Dataset storing all sequences as token ids from a shared vocabulary, in
+    two contiguous arrays together with the offsets at which every sequence
+    starts. Samples are returned as SampleViews, and statistics are kept as a
+    vector of counts per token id. Sequences are split on whitespace, so they
+    are returned with single spaces between tokens.
+    """
+    def __init__(self, filename : str=None, samples : list=None,
+                 vocabulary : Vocabulary=None, cache : bool=False):
+        self.vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+        self._reset()
+        if filename is not None:
+            self.load(filename, cache)
+        if samples is not None:
+            self.extend(samples)
+
+    @property
+    def statistics(self) -> Counter:
+        tokens = self.vocabulary.tokens
+        return Counter({tokens[i]: c for i, c in enumerate(self._counts) if c})
+
+    @property
+    def samples(self) -> list:
+        """A new list with views of all samples."""
+        self._compact()
+        return [self._view(p) for p in range(len(self))]
+
+    @samples.setter
+    def samples(self, samples : list):
+        samples = list(samples)
+        self._reset()
+        self.extend(samples)
+
+    def add(self, sample):
+        if isinstance(sample, SampleView) and sample.vocabulary is self.vocabulary:
+            source, target = sample.source_ids, sample.target_ids
+        else:
+            source = self.vocabulary.encode(sample.source.split())
+            target = self.vocabulary.encode(sample.target.split())
+        if self._index is not None:
+            self._index.setdefault(hash(source.tobytes()), []).append(len(self._source_offsets) - 1)
+        self._source_ids.extend(source)
+        self._source_offsets.append(len(self._source_ids))
+        self._target_ids.extend(target)
+        self._target_offsets.append(len(self._target_ids))
+        self._count(source, 1)
+
+    def remove(self, samples):
+        """Remove samples from the dataset. Samples are found by their source,
+        preferring a sample that also has the same target."""
+        for sample in samples:
+            source = self.vocabulary.lookup(sample.source.split())
+            positions = self._positions(source)
+            if not positions:
+                continue
+            position = next(
+                (p for p in positions if self._view(p).target == sample.target), positions[0]
+            )
+            self._index[hash(source.tobytes())].remove(position)
+            self._removed.add(position)
+            self._count(source, -1)
+
+    def get_by_source(self, source : str) -> list:
+        source = self.vocabulary.lookup(source.split())
+        return [self._view(p) for p in self._positions(source)]
+
+    def keep_top(self, n, seed : int=None):
+        self._compact()
+        positions = reservoir(range(len(self)), n, _seed(seed))
+        self.samples = [self._view(p) for p in positions]
+
+    def _load_arrays(self, arrays : Dict[str, np.ndarray]):
+        """Append the samples of a binary dataset with a few array operations,
+        translating its token ids to the ids of the shared vocabulary."""
+        mapping = np.frombuffer(self.vocabulary.encode(decode_vocabulary(arrays["vocabulary"])), dtype=np.int32)
+        for ids, offsets, name in ((self._source_ids, self._source_offsets, "source"),
+                                   (self._target_ids, self._target_offsets, "target")):
+            offsets.frombytes((arrays[name + "_offsets"][1:] + len(ids)).astype(np.int64).tobytes())
+            ids.frombytes(mapping[arrays[name + "_ids"]].astype(np.int32).tobytes())
+        self._index = None
+
+        if len(self._counts) < len(self.vocabulary):
+            self._counts.extend([0] * (len(self.vocabulary) - len(self._counts)))
+        counts = np.array(self._counts, dtype=np.int64)
+        counts[mapping] += arrays["counts"]
+        self._counts = array("q", counts.tobytes())
+
+    def _reset(self):
+        self._source_ids = array("i")
+        self._source_offsets = array("q", [0])
+        self._target_ids = array("i")
+        self._target_offsets = array("q", [0])
+        self._counts = array("q")
+        self._index = None
+        self._removed = set()
+
+    def _count(self, ids : array, increment : int):
+        if len(self._counts) < len(self.vocabulary):
+            self._counts.extend([0] * (len(self.vocabulary) - len(self._counts)))
+        for i in set(ids):
+            self._counts[i] += increment
+
+    def _positions(self, source : array) -> List[int]:
+        """Positions of the samples with the given source ids. The index from
+        hashed sources to positions is only built when it is first needed."""
+        if source is None:
+            return []
+        if self._index is None:
+            self._index = {}
+            for p in range(len(self._source_offsets) - 1):
+                if p in self._removed: continue
+                key = hash(self._source(p).tobytes())
+                self._index.setdefault(key, []).append(p)
+        positions = self._index.get(hash(source.tobytes()), [])
+        return [p for p in positions if self._source(p) == source]
+
+    def _source(self, position : int) -> array:
+        return self._source_ids[self._source_offsets[position]:self._source_offsets[position + 1]]
+
+    def _view(self, position : int):
+        return SampleView(
+            self.vocabulary,
+            self._source(position),
+            self._target_ids[self._target_offsets[position]:self._target_offsets[position + 1]]
+        )
+
+    def _compact(self):
+        if not self._removed:
+            return
+        views = [self._view(p) for p in range(len(self._source_offsets) - 1)
+                 if p not in self._removed]
+        self.samples = views
+
+    def __len__(self):
+        return len(self._source_offsets) - 1 - len(self._removed)
+
+    def __contains__(self, sample):
+        source = sample.source if isinstance(sample, (Sample, SampleView)) else sample
+        return len(self._positions(self.vocabulary.lookup(source.split()))) > 0
+
+    def __iter__(self):
+        return (self._view(p) for p in range(len(self._source_offsets) - 1)
+                if p not in self._removed)
+
+    def __getitem__(self, i):
+        self._compact()
+        if isinstance(i, slice):
+            return [self._view(p) for p in range(len(self))[i]]
+        return self._view(range(len(self))[i])
+
+
+class DatasetView(Dataset):
+    """
+    Subset of a parent dataset given by an array of positions in the parent,
+    that does not copy samples. Statistics are computed when they are first
+    read, and selecting, filtering or sampling a view creates another view of
+    the same parent, so chains of them only cost the number of selected
+    samples. The view copies its samples into a list of its own only when it
+    is changed; the parent should not be changed while the view is in use.
+    """
+    def __init__(self, parent : Dataset, positions : Iterable[int]):
+        # Views of views refer to the samples of the first parent directly
+        if isinstance(parent, DatasetView) and parent._parent is not None:
+            positions = [parent._positions[p] for p in positions]
+            parent = parent._parent
+        self._parent = parent
+        self._positions = array("q", positions)
+        self._statistics = None
+
+    @property
+    def statistics(self) -> Counter:
+        if self._statistics is None:
+            self._statistics = Counter()
+            for s in self:
+                self._update_statistics(s)
+        return self._statistics
+
+    @statistics.setter
+    def statistics(self, statistics : Counter):
+        self._statistics = statistics
+
+    @property
+    def samples(self) -> list:
+        if self._parent is None:
+            return Dataset.samples.fget(self)
+        return list(self)
+
+    @samples.setter
+    def samples(self, samples : list):
+        self._parent = None
+        Dataset.samples.fset(self, samples)
+
+    def add(self, sample):
+        self._materialize()
+        Dataset.add(self, sample)
+
+    def remove(self, samples):
+        self._materialize()
+        Dataset.remove(self, samples)
+
+    def extend(self, samples):
+        self._materialize()
+        Dataset.extend(self, samples)
+
+    def load(self, filename : str, cache : bool=False):
+        self._materialize()
+        Dataset.load(self, filename, cache)
+
+    def get_by_source(self, source : str) -> list:
+        if self._parent is None:
+            return Dataset.get_by_source(self, source)
+        return [s for s in self if s.source == source]
+
+    def keep_top(self, n, seed : int=None):
+        """Keep a random subset of n samples, by sampling positions."""
+        if self._parent is None:
+            return Dataset.keep_top(self, n, seed)
+        self._positions = array("q", reservoir(self._positions, n, _seed(seed)))
+        self._statistics = None
+
+    def _materialize(self):
+        """Copy the samples of the view into a list of its own."""
+        if self._parent is None:
+            return
+        samples = list(self)
+        statistics = self._statistics
+        self._parent = None
+        self._positions = None
+        self._samples = []
+        self._index = {}
+        self._removed = 0
+        self._statistics = Counter()
+        for sample in samples:
+            self._index.setdefault(sample.source, []).append(len(self._samples))
+            self._samples.append(sample)
+        if statistics is None:
+            for sample in samples:
+                self._update_statistics(sample)
+        else:
+            self._statistics = statistics
+
+    def __len__(self):
+        if self._parent is None:
+            return Dataset.__len__(self)
+        return len(self._positions)
+
+    def __contains__(self, sample):
+        if self._parent is None:
+            return Dataset.__contains__(self, sample)
+        source = sample.source if isinstance(sample, (Sample, SampleView)) else sample
+        return any(s.source == source for s in self)
+
+    def __iter__(self):
+        if self._parent is None:
+            return Dataset.__iter__(self)
+        parent = self._parent
+        return (parent[p] for p in self._positions)
+
+    def __getitem__(self, i):
+        if self._parent is None:
+            return Dataset.__getitem__(self, i)
+        if isinstance(i, slice):
+            return [self._parent[p] for p in self._positions[i]]
+        return self._parent[self._positions[i]]
+
+
+def _seed(seed : int=None) -> int:
+    """Seed for sampling, drawn from `random' if not given so that seeding
+    `random' keeps runs reproducible."""
+    return seed if seed is not None else random.getrandbits(64)
+
+
+def read_sample(line : str):
+    """Read a sample from a line with source and target separated by a tab."""
+    line = line.strip()
+    # Assume source and target are separated by a tab
+    [sequence, target] = line.split("\t")
+    return Sample(sequence, target)
+
+
+def open_text(filename : str):
+    """Open a text file for reading, through gzip if the name ends with .gz."""
+    if filename.endswith(".gz"):
+        return gzip.open(filename, "rt", encoding="utf-8")
+    return open(filename)
+
+
+def save_samples(samples : Iterable, filename : str, folder : str=""):
+    """Save samples with source and target separated by a tab per line. The
+    samples are written while they are iterated over, so that generators can
+    be saved without keeping all samples in memory, and a file only appears
+    once it is complete. Files ending with .gz are compressed, and files
+    ending with .npz are saved in the binary format. See SampleWriter."""
+    if folder:
+        if not os.path.exists(folder):
+            os.mkdir(folder)
+        filename = os.path.join(folder, filename)
+
+    if filename.endswith(".npz"):
+        save_binary(samples, filename + ".tmp", sync=True)
+        os.replace(filename + ".tmp", filename)
+        _fsync_directory(os.path.dirname(os.path.abspath(filename)))
+        return
+    with SampleWriter(filename) as writer:
+        writer.write(samples)
+
+
+def save_binary(samples : Iterable, filename : str, checksum : bytes=b"", sync : bool=False):
+    """Save samples in the binary format: an uncompressed .npz file with the
+    token ids of all sources and targets, the offsets at which every sequence
+    starts, the vocabulary and the number of sources containing every token.
+    Sequences are split on whitespace, so the few samples with other
+    whitespace than single spaces between tokens are also stored as text,
+    with their positions. With sync=True the file is synced to disk before
+    it is closed."""
+    dataset = CompactDataset()
+    exact_positions = array("q")
+    exact_samples = []
+    for position, sample in enumerate(samples):
+        dataset.add(sample)
+        if not isinstance(sample, SampleView) and \
+                (not _normalized(sample.source) or not _normalized(sample.target)):
+            exact_positions.append(position)
+            exact_samples.append("{}\t{}".format(sample.source, sample.target))
+    with open(filename, "wb") as f:
+        np.savez(
+            f,
+            vocabulary=np.frombuffer("\n".join(dataset.vocabulary.tokens).encode("utf-8"), dtype=np.uint8),
+            source_ids=np.frombuffer(dataset._source_ids, dtype=np.int32),
+            source_offsets=np.frombuffer(dataset._source_offsets, dtype=np.int64),
+            target_ids=np.frombuffer(dataset._target_ids, dtype=np.int32),
+            target_offsets=np.frombuffer(dataset._target_offsets, dtype=np.int64),
+            counts=np.frombuffer(dataset._counts, dtype=np.int64),
+            exact_positions=np.frombuffer(exact_positions, dtype=np.int64),
+            exact_samples=np.frombuffer("\n".join(exact_samples).encode("utf-8"), dtype=np.uint8),
+            checksum=np.frombuffer(checksum, dtype=np.uint8)
+        )
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def load_binary(filename : str) -> Dict[str, np.ndarray]:
+    """Memory-map the arrays of a dataset in the binary format. The members of
+    an uncompressed .npz file are stored as they are in memory, so they are
+    mapped in place instead of being read. Compressed archives, for instance
+    saved with np.savez_compressed, cannot be mapped and are rejected."""
+    data = np.memmap(filename, dtype=np.uint8, mode="r")
+    arrays = {}
+    with zipfile.ZipFile(filename) as archive, open(filename, "rb") as f:
+        for info in archive.infolist():
+            name = info.filename[:-len(".npy")]
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError("{} is compressed, save it with save_binary instead.".format(filename))
+            # Skip the local zip header and the .npy header of the member
+            f.seek(info.header_offset + 26)
+            lengths = np.frombuffer(f.read(4), dtype="<u2")
+            f.seek(info.header_offset + 30 + int(lengths[0]) + int(lengths[1]))
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+            size = int(np.prod(shape)) * dtype.itemsize
+            arrays[name] = data[f.tell():f.tell() + size].view(dtype).reshape(shape)
+    return arrays
+
+
+def load_cached_binary(filename : str) -> Dict[str, np.ndarray]:
+    """Memory-map the binary copy of a tab separated file, cached next to it
+    in `<filename>.npz'. The copy is rebuilt when the content hash of the file
+    differs from the one stored in the copy."""
+    digest = hashlib.blake2b()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    checksum = digest.digest()
+
+    cache = filename + ".npz"
+    try:
+        arrays = load_binary(cache)
+        # Copies saved before the exact samples were stored are rebuilt
+        if arrays["checksum"].tobytes() == checksum and "exact_positions" in arrays:
+            return arrays
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        pass
+
+    with open_text(filename) as f:
+        save_binary((read_sample(line) for line in f), cache + ".tmp", checksum)
+    os.replace(cache + ".tmp", cache)
+    return load_binary(cache)
+
+
+def decode_vocabulary(vocabulary : np.ndarray) -> List[str]:
+    text = vocabulary.tobytes().decode("utf-8")
+    return text.split("\n") if text else []
+
+
+def decode_exact(arrays : Dict[str, np.ndarray]) -> Dict[int, "Sample"]:
+    """The samples of a binary dataset that are stored as text, by position."""
+    if "exact_positions" not in arrays or len(arrays["exact_positions"]) == 0:
+        return {}
+    lines = arrays["exact_samples"].tobytes().decode("utf-8").split("\n")
+    return {position: Sample(*line.split("\t"))
+            for position, line in zip(arrays["exact_positions"].tolist(), lines)}
+
+
+def _normalized(sequence : str) -> bool:
+    """Whether a sequence has single spaces between its tokens, and no other
+    whitespace."""
+    return " ".join(sequence.split()) == sequence
+
+
+def decode_sequences(tokens : List[str], ids : np.ndarray, offsets : np.ndarray) -> List[str]:
+    """Decode all sequences at once, by joining their tokens into one string
+    with a newline after every sequence, and splitting that string again."""
+    ends = np.asarray(offsets[1:])
+    # Id len(tokens) is the newline inserted at the end of every sequence
+    ids = np.insert(np.asarray(ids, dtype=np.int64), ends, len(tokens))
+    text = " ".join(np.array(tokens + ["\n"], dtype=object)[ids].tolist())
+    return [sequence.strip(" ") for sequence in text.split("\n")[:-1]]
+
+
 class Sample:
+    __slots__ = ("source", "target")
+
     def __init__(self, source, target):
         self.source = source
         self.target = target
 
     def __str__(self):
-        return "Sample, Input: `{}', Target: `{}'".format(self.source, self.target)
\ No newline at end of file
+        return "Sample, Input: `{}', Target: `{}'".format(self.source, self.target)
+
+
+class SampleView:
+    """Sample of a CompactDataset, holding token ids that are only converted
+    to strings when the source or target is read."""
+    __slots__ = ("vocabulary", "source_ids", "target_ids")
+
+    def __init__(self, vocabulary : Vocabulary, source_ids : array, target_ids : array):
+        self.vocabulary = vocabulary
+        self.source_ids = source_ids
+        self.target_ids = target_ids
+
+    @property
+    def source(self) -> str:
+        return " ".join(self.vocabulary.decode(self.source_ids))
+
+    @property
+    def target(self) -> str:
+        return " ".join(self.vocabulary.decode(self.target_ids))
+
+    def __deepcopy__(self, memo):
+        # The vocabulary is shared, only the token ids are copied
+        return SampleView(self.vocabulary, array("i", self.source_ids),
+                          array("i", self.target_ids))
+
+    def __str__(self):
+        return "Sample, Input: `{}', Target: `{}'".format(self.source, self.target)
@@ -0,0 +1,160 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import re
+
+from typing import Dict, Iterator, List, Tuple
+from dataset import open_text
+
+
+# Variables holding the output of an earlier step of an unrolled sample
+VARIABLE = re.compile(r"^\*\d+$")
+
+
+class Scores:
+    """
+    Accuracies of predictions for a generated test set, accumulated batch by
+    batch. Rows whose target is a variable of an unrolled sample have no
+    target of their own and are only used for the consistency of localism.
+
+    Attributes:
+        samples: number of scored rows.
+        exact: rows whose prediction is the target string.
+        correct: rows whose predicted tokens are the target tokens.
+        tokens: number of positions in the longer of target and prediction.
+        correct_tokens: predicted tokens equal to the target token at their
+            position.
+        groups: localism chains or substitutivity pairs that were compared.
+        consistent: groups whose predictions agree: the chain of unrolled
+            predictions gives the prediction for the original sample, or the
+            predictions for a sample and its synonym sample are the same.
+    """
+    def __init__(self):
+        self.samples = 0
+        self.exact = 0
+        self.correct = 0
+        self.tokens = 0
+        self.correct_tokens = 0
+        self.groups = 0
+        self.consistent = 0
+
+    def add(self, target : str, prediction : str):
+        target, prediction = target.strip(), prediction.strip()
+        self.samples += 1
+        self.exact += target == prediction
+        target, prediction = target.split(), prediction.split()
+        self.correct += target == prediction
+        self.tokens += max(len(target), len(prediction))
+        self.correct_tokens += sum(t == p for t, p in zip(target, prediction))
+
+    def compare(self, consistent : bool):
+        self.groups += 1
+        self.consistent += consistent
+
+    @property
+    def sequence_accuracy(self) -> float:
+        return self.correct / self.samples if self.samples else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        summary = {
+            "samples": self.samples,
+            "exact_match": self.exact / self.samples if self.samples else 0.0,
+            "sequence_accuracy": self.sequence_accuracy,
+            "token_accuracy": self.correct_tokens / self.tokens if self.tokens else 0.0
+        }
+        if self.groups:
+            summary["consistency"] = self.consistent / self.groups
+        return summary
+
+
+def read_rows(filename : str, predictions : str, batch_size : int) -> Iterator[List[Tuple[str, str, str, str]]]:
+    """Read batches of (type, source, target, prediction) from a test set and
+    the prediction file with a line per row of the test set. The type is
+    empty for test sets without one. Files ending with .gz are decompressed."""
+    with open_text(filename) as f_test, open_text(predictions) as f_predictions:
+        while True:
+            lines = list(itertools.islice(f_test, batch_size))
+            predicted = list(itertools.islice(f_predictions, len(lines)))
+            if len(predicted) < len(lines):
+                raise ValueError("{} has fewer lines than {}.".format(predictions, filename))
+            if not lines:
+                if f_predictions.readline().strip():
+                    raise ValueError("{} has more lines than {}.".format(predictions, filename))
+                return
+            batch = []
+            for line, prediction in zip(lines, predicted):
+                columns = line.rstrip("\n").split("\t")
+                if len(columns) == 2:
+                    columns.insert(0, "")
+                batch.append((columns[0], columns[1], columns[2], prediction.rstrip("\n")))
+            yield batch
+
+
+def expand(prediction : List[str], variables : Dict[str, List[str]]) -> List[str]:
+    """Replace the variables in a prediction by the predictions of the steps
+    defining them, which are already expanded."""
+    expanded = []
+    for token in prediction:
+        expanded.extend(variables.get(token, [token]))
+    return expanded
+
+
+def evaluate(experiment_type : str, filename : str, predictions : str,
+             batch_size : int=10000) -> Scores:
+    """Score the predictions for a generated test set, streaming both files in
+    batches so that only one batch and one unrolled sample are in memory.
+
+    For localism, the prediction of every unrolled step is stored under the
+    variable that is its target, the variables in the prediction of the last
+    step are replaced by the predictions they stand for, and the result is
+    compared to the prediction for the original sample. For substitutivity,
+    the predictions for every original and synonym sample are compared."""
+    scores = Scores()
+    variables = {}
+    chain = None
+    previous = None
+    for batch in read_rows(filename, predictions, batch_size):
+        for kind, source, target, prediction in batch:
+            if experiment_type == "localism" and kind == "unrolled":
+                chain = expand(prediction.split(), variables)
+                if VARIABLE.match(target.strip()):
+                    variables[target.strip()] = chain
+                    continue
+            elif experiment_type == "localism" and kind == "original":
+                if chain is not None:
+                    scores.compare(chain == prediction.split())
+                variables, chain = {}, None
+            elif experiment_type == "substitutivity" and kind == "synonym":
+                if previous is not None:
+                    scores.compare(previous == prediction.split())
+                previous = None
+            elif experiment_type == "substitutivity":
+                previous = prediction.split()
+            scores.add(target, prediction)
+    return scores
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--type', type=str, required=True,
+                        choices=["localism", "exceptions", "substitutivity", "systematicity"])
+    parser.add_argument('--test', type=str, required=True, help="Generated test set.")
+    parser.add_argument('--predictions', type=str, default=None,
+                        help="Predictions with a line per line of the test set, by default `<test>.pred'.")
+    parser.add_argument('--batch_size', type=int, default=10000)
+    parser.add_argument('--log_level', type=str, default="info")
+    args = vars(parser.parse_args())
+    logging.basicConfig(level=args["log_level"].upper(),
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    predictions = args["predictions"] if args["predictions"] is not None else args["test"] + ".pred"
+    if not os.path.isfile(args["test"]):
+        logging.error("Please enter an existing test set.")
+    elif not os.path.isfile(predictions):
+        logging.error("Please enter an existing prediction file.")
+    else:
+        scores = evaluate(args["type"], args["test"], predictions, args["batch_size"])
+        print(json.dumps(scores.summary(), indent=4))
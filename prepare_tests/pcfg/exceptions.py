@@ -2,46 +2,52 @@ import argparse
 import logging
 import os
 import re
-import copy
 import json
 import random
+import itertools
 
-from typing import List, Tuple
+from collections import Counter
+from typing import Callable, Dict, List, Set, Tuple
 
-import handlers
 from handlers import DatasetHandler
-from dataset import Dataset, Sample
+from dataset import Dataset, Sample, save_samples
+from index import TokenIndex
+from profiling import profiler
+from pipeline import generate
 
 
 def exceptions(handler : DatasetHandler, dataset : Dataset, test : Dataset):
     """For all templates, collect exceptions and save training and testing
     datasets."""
 
-    def collect_exceptions(dataset, template : str, token1 : str, token2 : str) -> Tuple[List[Sample], List[Sample]]:
-        """Collect all samples whose source sequence matches the 'template'."""
+    def collect_exceptions(get_sample : Callable[[int], Sample], index : TokenIndex,
+                           removed : Set[int], template : str, token1 : str,
+                           token2 : str) -> Tuple[Dataset, List[int]]:
+        """Collect all samples whose source sequence matches the 'template'.
+        The index narrows the search down to samples in which token2 follows
+        token1, so the template should only match such samples. Returns the
+        exceptions and the ids of all matching samples, which are marked as
+        removed."""
         exceptions = Dataset()
         regex = re.compile(template)
 
-        new_samples = []
-        for sample in dataset:
-            match = regex.match(sample.source)
-            if not match is None:
-                if sample.source.count(token1) == 1 and sample.source.count(token2) == 1:
-                    exceptions.add(sample)
-                # else:
-                #     print(template, sample.source)
-            else:
-                new_samples.append(sample)
-
-        dataset_exceptions_removed = Dataset(samples=new_samples)
-        return exceptions, dataset_exceptions_removed
-
-    def acquire_alternative_targets(exceptions : List[Sample], handler : DatasetHandler, token1 : str, token2 : str) -> List[Sample]:
+        matches = []
+        for i in index.lookup(token1, token2):
+            if i in removed: continue
+            sample = get_sample(i)
+            if regex.match(sample.source) is None: continue
+            if index.count(token1, i) == 1 and index.count(token2, i) == 1:
+                exceptions.add(sample)
+            removed.add(i)
+            matches.append(i)
+        return exceptions, matches
+
+    def acquire_alternative_targets(exceptions : Dataset, handler : DatasetHandler, token1 : str, token2 : str) -> List[Sample]:
         """Collect the adapted targets for the exceptions gathered in the source."""
         exceptions_alternative_targets = Dataset()
         samples_to_remove = []
-        for sample in exceptions:
-            new_target, _, _ = handler.get_target(sample.source, token1, token2)
+        new_targets = handler.get_targets([sample.source for sample in exceptions], token1, token2)
+        for sample, new_target in zip(exceptions, new_targets):
             new_target = " ".join(new_target)
             if new_target != sample.target:
                 new_sample = Sample(sample.source, new_target)
@@ -51,51 +57,86 @@ def exceptions(handler : DatasetHandler, dataset : Dataset, test : Dataset):
         exceptions.remove(samples_to_remove)
         return exceptions_alternative_targets
 
+    def get_sample(i : int) -> Sample:
+        return dataset[i] if i < n_samples else test[i - n_samples]
+
     n_samples = len(dataset)
-    n_exceptions = int(len(dataset) * handler.percentage)
-    dataset.extend(test.samples)
     logging.info("Dataset contains {} samples.".format(n_samples))
     exceptions_test = Dataset()
     exceptions_test_adapted = Dataset()
 
+    # Index training and testing samples once, by their position in both sets
+    # together. Samples matching a template are removed by marking their ids.
+    with profiler.stage("index", len(dataset) + len(test)):
+        index = TokenIndex(itertools.chain(dataset, test),
+                           tokens=handler.candidates1 + handler.candidates2)
+    statistics = Counter({token: len(index.occurrences(token)) for token in index.counts})
+    removed = set()
+
     for token1, token2 in zip(handler.candidates1, handler.candidates2):
-        n_exceptions = round(handler.percentage * min(dataset.statistics[token1], dataset.statistics[token2]))
+        n_exceptions = round(handler.percentage * min(statistics[token1], statistics[token2]))
         logging.info("Creating {} exceptions for {} - {}.".format(n_exceptions, token1, token2))
         if token1 == token2: continue
         tmp_template = handler.template.format(token1, token2)
-        exceptions, dataset = collect_exceptions(dataset, tmp_template, token1, token2)
-        short_samples = [s for s in exceptions.samples if handler.count_functions(s.source) == 2]
-        long_samples = [s for s in exceptions.samples if handler.count_functions(s.source) > 2]
-        exceptions_test.extend(copy.deepcopy(short_samples[:int(n_exceptions / 2)] + long_samples[:int(n_exceptions / 2)]))
-
-        original_samples = Dataset(samples=short_samples[:int(n_exceptions / 2)] + long_samples[:int(n_exceptions / 2)])
-        adapted_samples = acquire_alternative_targets(original_samples, handler, token1, token2)
-        exceptions_test_adapted.extend(adapted_samples)
-
-    dataset.samples = dataset.samples[:n_samples]
-    dataset.extend(exceptions_test_adapted.samples)
+        with profiler.stage("collect {} - {}".format(token1, token2)) as record:
+            exceptions, matches = collect_exceptions(get_sample, index, removed, tmp_template, token1, token2)
+            for i in matches:
+                for token in index.counts:
+                    if index.count(token, i): statistics[token] -= 1
+            functions = [handler.count_functions(s.source) for s in exceptions]
+            short_samples = [p for p, n in enumerate(functions) if n == 2]
+            long_samples = [p for p, n in enumerate(functions) if n > 2]
+            # Samples are never changed in place, so the test set shares them
+            original_samples = exceptions.select(short_samples[:int(n_exceptions / 2)] + long_samples[:int(n_exceptions / 2)])
+            exceptions_test.extend(original_samples)
+            record["samples"] = len(index.lookup(token1, token2))
+
+        with profiler.stage("targets {} - {}".format(token1, token2), int(n_exceptions / 2) * 2):
+            adapted_samples = acquire_alternative_targets(original_samples, handler, token1, token2)
+            exceptions_test_adapted.extend(adapted_samples)
+
+    # The new training set holds the first remaining samples and the exceptions
+    remaining = (s for i, s in enumerate(itertools.chain(dataset, test)) if i not in removed)
+    train = itertools.chain(itertools.islice(remaining, n_samples), exceptions_test_adapted)
     directory = os.path.join(handler.output_dir, "exceptions/")
     fname = "train.tsv".format(token1, token2)
-    dataset.save(fname, directory) 
+    with profiler.stage("save", n_samples):
+        save_samples(train, fname, directory)
 
     # Save exceptions adapted target
     fname = "test_adapted.tsv".format(token1, token2)
     directory = os.path.join(handler.output_dir, "exceptions/")
-    exceptions_test_adapted.samples = [s for s in exceptions_test_adapted.samples if handler.count_functions(s.source) == 2 ]
+    exceptions_test_adapted = exceptions_test_adapted.filter(lambda s: handler.count_functions(s.source) == 2)
     exceptions_test_adapted.save(fname, directory)
 
     # Save exceptions original target
     fname = "test_original.tsv".format(token1, token2)
     directory = os.path.join(handler.output_dir, "exceptions/")
-    exceptions_test.samples = [s for s in exceptions_test.samples if handler.count_functions(s.source) == 2 ]
+    exceptions_test = exceptions_test.filter(lambda s: handler.count_functions(s.source) == 2)
     exceptions_test.save(filename=fname, folder=directory)
 
 
+def stages(config : Dict[str, Dict], seed : int=None) -> List[Tuple[str, List[str], List[str], int]]:
+    """(stage, inputs, outputs, seed) of every stage, for the artifact cache.
+    Exceptions do not depend on the seed."""
+    directory = os.path.join(config["general"]["output_dir"], "exceptions")
+    return [("exceptions", [config["general"]["train"], config["general"]["test"]],
+             [os.path.join(directory, f) for f in ["train.tsv", "test_adapted.tsv", "test_original.tsv"]], None)]
+
+
+def run_stage(handler : DatasetHandler, stage : str, workers : int=1):
+    exceptions(handler, handler.train, handler.test)
+
+
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser()
     parser.add_argument('--config', type=str, default="config.json")
     parser.add_argument('--log_level', type=str, default="info")
+    parser.add_argument('--profile', type=str, nargs="?", const="profile.json", default=None,
+                        help="Save a profile of the run as JSON to this file.")
+    parser.add_argument('--force', action="store_true",
+                        help="Regenerate the outputs even if they are up to date.")
     args = vars(parser.parse_args())
     logging.basicConfig(level=args["log_level"].upper(),
                         format='%(asctime)s - %(levelname)s - %(message)s')
@@ -110,6 +151,4 @@ if __name__ == '__main__':
             print("{} : {}".format(k, v))
         print()
 
-        handler = getattr(handlers, config["general"]["handler"])
-        handler = handler(config=config, mode="exceptions")
-        exceptions(handler, handler.train, handler.test)
\ No newline at end of file
+        generate(config, {"exceptions": (stages, run_stage)}, 1, 1, args["force"], args["profile"])
@@ -1,11 +1,88 @@
-import re
 import os
-import random
 import logging
+import itertools
 import subprocess
 
-from typing import List, Tuple, Dict
-from dataset import Dataset, Sample
+from collections import OrderedDict
+from typing import Iterable, List, Tuple, Dict, Union
+from dataset import Dataset, LazyDataset, CompactDataset, Vocabulary, Sample
+from profiling import profiler
+from sampling import LetterSampler
+from evaluation import evaluate
+
+
+class Node:
+    """
+    Function call in a parsed PCFG sequence, holding the function name and a
+    tuple with its arguments. A parsed sequence is a tree of Nodes with tuples
+    of letters as leaves. Nodes are immutable and compare by value, and their
+    hash is computed once, so that subtrees are cheap dictionary keys.
+    """
+    __slots__ = ("function", "args", "_hash")
+
+    def __init__(self, function : str, args : tuple):
+        self.function = function
+        self.args = args
+        self._hash = hash((function, args))
+
+    def __eq__(self, other):
+        return self is other or (
+            isinstance(other, Node) and self._hash == other._hash and
+            self.function == other.function and self.args == other.args
+        )
+
+    def __hash__(self):
+        return self._hash
+
+    def __getstate__(self):
+        return self.function, self.args
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __repr__(self):
+        return "Node(function={!r}, args={!r})".format(self.function, self.args)
+
+
+class LRUCache:
+    """
+    Mapping with at most `maxsize' entries, that evicts the least recently used
+    entry when it is full and counts how often lookups hit or miss.
+    """
+    def __init__(self, maxsize : int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        value = self._entries.get(key, default)
+        if value is default:
+            self.misses += 1
+        else:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self._entries), "maxsize": self.maxsize}
+
+    def __len__(self):
+        return len(self._entries)
 
 
 class DatasetHandler:
@@ -18,6 +95,13 @@ class DatasetHandler:
         output_dir: directory to store data needed for compositionality tests.
         train: filename of training dataset.
         test: filename of testing dataset.
+        lazy: whether to memory-map the datasets instead of loading them.
+            Lazy datasets read the tab separated files themselves, so
+            binary_cache has no effect on them.
+        compact: whether to store the datasets as token ids with a shared
+            vocabulary. Cannot be combined with lazy.
+        binary_cache: whether to load the datasets from binary copies cached
+            next to them, which are rebuilt when the files change.
         evaluate_command: command to run to get the accuracy for test set.
 
     Attributes for exception generation:
@@ -29,11 +113,49 @@ class DatasetHandler:
 
     Attributes for localism experiments:
         percentage: percentage of training sequences to unroll.
+        deduplicate: whether to save a table of the unique unrolled
+            sub-expressions that samples refer to, instead of unrolling every
+            sample in full.
+
+    Attributes for substitutivity experiments:
+        percentage: percentage of training sequences per candidate in which
+            the candidate is replaced by its synonym.
+        candidates: which words get a synonym.
+        synonyms: the synonym of every candidate.
+
+    Methods listed in `profiled_methods' have their calls counted when the run
+    is profiled. General settings listed in `output_settings' can change the
+    generated datasets, so changing them generates the datasets again.
     """
+    profiled_methods = ["unroll", "get_target", "get_targets"]
+    output_settings = ["lazy", "compact", "binary_cache"]
+
     def __init__(self, config : Dict[str, Dict], mode : str):
         self.output_dir = config["general"]["output_dir"]
-        self.train = Dataset(filename=config["general"]["train"])
-        self.test = Dataset(filename=config["general"]["test"])
+        cache = config["general"].get("binary_cache", False)
+        if config["general"].get("lazy", False):
+            if config["general"].get("compact", False):
+                raise ValueError("The lazy and compact settings cannot be combined, choose one of them.")
+            if cache:
+                logging.warning("Lazy datasets are read from the files, the binary cache is not used.")
+        with profiler.stage("load") as record:
+            if config["general"].get("lazy", False):
+                self.train = LazyDataset(config["general"]["train"])
+                self.test = LazyDataset(config["general"]["test"])
+            elif config["general"].get("compact", False):
+                vocabulary = Vocabulary()
+                self.train = CompactDataset(config["general"]["train"], vocabulary=vocabulary, cache=cache)
+                self.test = CompactDataset(config["general"]["test"], vocabulary=vocabulary, cache=cache)
+            else:
+                self.train = Dataset(filename=config["general"]["train"], cache=cache)
+                self.test = Dataset(filename=config["general"]["test"], cache=cache)
+            record["samples"] = len(self.train) + len(self.test)
+        self.set_mode(config, mode)
+
+    def set_mode(self, config : Dict[str, Dict], mode : str):
+        """Set the attributes of an experiment, so that one handler can run
+        several experiments on the same loaded data."""
+        self.mode = mode
         if mode == "exceptions":
             self.template = config["exceptions"]["template"]
             self.position = config["exceptions"]["position"]
@@ -44,14 +166,30 @@ class DatasetHandler:
             self.candidates2 = config["exceptions"]["candidates2"]
         elif mode == "localism":
             self.percentage = config["localism"]["percentage"]
+            self.deduplicate = config["localism"].get("deduplicate", False)
         elif mode == "substitutivity":
             self.percentage = config["substitutivity"]["percentage"]
             self.candidates = config["substitutivity"]["candidates"]
+            self.synonyms = {c: "{}_syn".format(c) for c in self.candidates}
         elif mode == "systematicity":
             self.candidates = config["systematicity"]["candidates"]
             self.percentage = config["systematicity"]["inputs_percentage"]
             #self.inputs = config["systematicity"]["inputs"]
 
+    def worker_settings(self) -> Dict:
+        """Settings of the handler without its data, to send to worker
+        processes, which rebuild the handler with `from_settings'."""
+        settings = self.__dict__.copy()
+        settings["train"] = None
+        settings["test"] = None
+        return settings
+
+    @classmethod
+    def from_settings(cls, settings : Dict) -> "DatasetHandler":
+        handler = cls.__new__(cls)
+        handler.__dict__.update(settings)
+        return handler
+
     def unroll(self, sample : Sample, output : Tuple[str, List[Tuple[str, str]], int], variable_counter : int) -> Tuple[str, List[Tuple[str, str]], int]:
         raise NotImplementedError("To be implemented")
         return sequence, output, variable_counter
@@ -60,185 +198,273 @@ class DatasetHandler:
         raise NotImplementedError("To be implemented")
         return sequence
 
-    def get_test_accuracy(self, experiment_type : str, fname : str) -> float:
-        raise NotImplementedError("To be implemented")
-        return accuracy
+    def get_targets(self, sources : List[str], token1 : str=None, token2 : str=None) -> List[List[str]]:
+        """Compute the targets of many source sequences at once."""
+        return [self.get_target(source, token1, token2)[0] for source in sources]
+
+    def validate(self, dataset : Dataset, batch_size : int=10000) -> List[Sample]:
+        """Return the samples whose target differs from the computed target."""
+        invalid = []
+        samples = iter(dataset)
+        for batch in iter(lambda: list(itertools.islice(samples, batch_size)), []):
+            targets = self.get_targets([sample.source for sample in batch])
+            invalid.extend(sample for sample, target in zip(batch, targets)
+                           if " ".join(target) != sample.target)
+        return invalid
+
+    def get_test_accuracy(self, experiment_type : str, fname : str, predictions : str=None) -> float:
+        """Sequence accuracy of the predictions for a generated test set, with
+        a line per line of the test set in `predictions', by default in
+        `<fname>.pred'. Both files are streamed, see evaluation.evaluate for
+        the other scores."""
+        if predictions is None:
+            predictions = fname + ".pred"
+        return evaluate(experiment_type, fname, predictions).sequence_accuracy
+
+    def seed(self, seed : int, stream : int=0):
+        """Seed the random letters drawn by the handler. Every worker process
+        should use its own stream of the seed."""
+        pass
+
+    def cache_info(self) -> Dict[str, Dict[str, int]]:
+        """Statistics of the caches used by the handler, per cache."""
+        return {}
 
 
 class PCFGHandler(DatasetHandler):
     """
     Dataset handler written for PCFG dataset.
+
+    Parsed sequences are kept in an LRU cache of `parse_cache_size' entries
+    (general section of the config), so that a sequence is parsed once for
+    unrolling, counting and target computation. Targets of subtrees can be
+    cached per replacement context as well, by setting `cache_size'. That only
+    pays off if many samples share subtrees, so it is disabled by default.
+
+    Random letters, replacements and primitives are drawn in batches by a
+    LetterSampler over the letters of the training set, see `seed'.
     """
+    profiled_methods = DatasetHandler.profiled_methods + [
+        "parse", "compile", "run", "count_functions", "is_primitive", "_place_brackets"
+    ]
+
     def __init__(self, config : Dict[str, Dict], mode : str):
-        super().__init__(config, mode)
+        self.parses = LRUCache(config["general"].get("parse_cache_size", 100000))
+        self.cache = LRUCache(config["general"].get("cache_size", 0))
         self.binary = ["append", "prepend", "remove_first", "remove_second"]
         self.unary = ["echo", "swap_first_last", "repeat", "shift", "reverse", "copy"]
         self.functions = self.binary + self.unary
-        self.letters = []
-        for s in self.train:
-            for t in s.source.split():
-                if t.lower() != t:
-                    self.letters.append(t)
-        self.letters = list(set(self.letters))
+        self.arity = {**{f: 2 for f in self.binary}, **{f: 1 for f in self.unary}}
+        self.opcodes = {f: i for i, f in enumerate(self.functions)}
+        super().__init__(config, mode)
+        # Every distinct source token of the training set is in its statistics
+        with profiler.stage("letter scan", len(self.train)):
+            self.letters = [t for t in self.train.statistics if t.lower() != t]
+        self.sampler = LetterSampler(self.letters)
+
+    def set_mode(self, config : Dict[str, Dict], mode : str):
+        super().set_mode(config, mode)
+        # Synonyms are parsed and executed as the function they replace
+        for function, synonym in getattr(self, "synonyms", {}).items():
+            self.arity[synonym] = self.arity[function]
+            self.opcodes[synonym] = self.opcodes[function]
+
+    def seed(self, seed : int, stream : int=0):
+        self.sampler.seed(seed, stream)
+
+    def worker_settings(self) -> Dict:
+        # Worker processes start with empty caches
+        settings = super().worker_settings()
+        settings["parses"] = LRUCache(self.parses.maxsize)
+        settings["cache"] = LRUCache(self.cache.maxsize)
+        return settings
 
     def unroll(self, sample : Sample):
-        source = self._place_brackets(sample.source)
-        _, unrolled_samples, _ = self._unroll_recursively(source, [], 0)
+        tree = self.parse(sample.source)
+        _, unrolled_samples, _ = self._unroll_recursively(tree, [], 0)
         return unrolled_samples
 
     def get_target(self, source : str, token1 : str, token2 : str) -> str:
-        sequence = self._place_brackets(source)
-        sequence = self._get_target_recursively(sequence, token1, token2)
-        return sequence
+        sequence = self.get_targets([source], token1, token2)[0]
+        return sequence, token1, token2
+
+    def get_targets(self, sources : List[str], token1 : str=None, token2 : str=None) -> List[List[str]]:
+        context = self._context(token1, token2)
+        programs = (self._compile_tree(self.parse(source), [], context) for source in sources)
+        return self.run(programs, token1, token2)
+
+    def cache_info(self) -> Dict[str, Dict[str, int]]:
+        return {"parses": self.parses.info(), "subtrees": self.cache.info()}
 
     def is_primitive(self, sequence : str) -> bool:
-        function_calls = self.count_functions(sequence)
-        return True if function_calls == 1 else False
+        tree = self.parse(sequence)
+        return isinstance(tree, Node) and \
+            not any(isinstance(arg, Node) for arg in tree.args)
 
     def count_functions(self, sequence : str) -> int:
-        function_calls = 0
+        return self._count_functions(self.parse(sequence))
+
+    def parse(self, sequence : str) -> Union[Node, Tuple[str, ...]]:
+        """Parse a source sequence into a tree in a single pass over its tokens.
+        Function calls are kept on a stack until all of their arguments are
+        complete; a comma ends the first argument of a binary function."""
+        tree = self.parses.get(sequence)
+        if tree is None:
+            tree = self._parse(sequence)
+            self.parses.put(sequence, tree)
+        return tree
+
+    def _parse(self, sequence : str) -> Union[Node, Tuple[str, ...]]:
+        frames = []
+        letters = []
         for token in sequence.split():
-            if token in self.functions: function_calls += 1
-        return function_calls
-
-    def replace_letters(self, sequence : str, replacements : List[str]) -> str:
-        letters_to_use = list(set(self.letters) - set(replacements))
-        sequence = sequence.split()
-        for i, token in enumerate(sequence):
-            if token in replacements:
-                sequence[i] = letters_to_use[random.randint(0, len(letters_to_use)-1)]
-        return " ".join(sequence)
-
-    def keep_letters(self, sequence : str, keep : List[str]) -> str:
-        sequence = sequence.split()
-        for i, token in enumerate(sequence):
-            if token not in keep and token not in self.functions and token != ",":
-                sequence[i] = random.sample(keep, 1)[0]
-        return " ".join(sequence)
+            if token in self.arity:
+                if letters:
+                    raise ValueError("Unexpected function `{}' in `{}'.".format(token, sequence))
+                frames.append((token, []))
+            elif token == ",":
+                if not letters or self._close_argument(frames, tuple(letters)) is not None:
+                    raise ValueError("Unexpected comma in `{}'.".format(sequence))
+                letters = []
+            else:
+                letters.append(token)
+        if frames and not letters:
+            raise ValueError("Missing argument in `{}'.".format(sequence))
+        tree = self._close_argument(frames, tuple(letters))
+        if tree is None:
+            raise ValueError("Missing argument in `{}'.".format(sequence))
+        return tree
+
+    def compile(self, sequence : str, token1 : str=None, token2 : str=None) -> tuple:
+        """Compile a source sequence into a postfix program for `run'. Every
+        operation is a pair of an opcode and an operand: an opcode of None
+        pushes the operand's letters, other opcodes apply a function to the top
+        of the stack and have the subtree they compute as operand. Subtrees
+        with a cached target for the replacement context are pushed as is."""
+        context = self._context(token1, token2)
+        return tuple(self._compile_tree(self.parse(sequence), [], context))
+
+    def run(self, programs : Iterable[tuple], token1 : str=None, token2 : str=None) -> List[List[str]]:
+        """Compute the targets of compiled programs with a stack machine. The
+        functions token1 and token2 are executed as their replacements."""
+        context = self._context(token1, token2)
+        caching = self.cache.maxsize > 0
+        operations = [getattr(self, "_" + f) for f in self.functions]
+        for token in (token1, token2):
+            if token in self.opcodes:
+                operations[self.opcodes[token]] = getattr(self, "_" + self.replacements[token])
+        binary = [self.arity[f] == 2 for f in self.functions]
+
+        stack = []
+        targets = []
+        for program in programs:
+            for opcode, operand in program:
+                if opcode is None:
+                    stack.append(list(operand))
+                    continue
+                elif binary[opcode]:
+                    argument = stack.pop()
+                    stack[-1] = operations[opcode](stack[-1], argument)
+                else:
+                    stack[-1] = operations[opcode](stack[-1])
+                if caching:
+                    self.cache.put((operand._hash, context), (operand, tuple(stack[-1])))
+            targets.append(stack.pop())
+        return targets
+
+    def replace_letters(self, sequence : Union[str, List[str]], replacements : List[str]) -> Union[str, List[str]]:
+        """Replace the letters in `replacements' by other random letters, in one
+        sequence or in a list of sequences at once."""
+        if isinstance(sequence, str):
+            return self.sampler.replace([sequence], replacements)[0]
+        return self.sampler.replace(sequence, replacements)
+
+    def keep_letters(self, sequence : Union[str, List[str]], keep : List[str]) -> Union[str, List[str]]:
+        """Replace all letters that are not in `keep' by random letters of
+        `keep', in one sequence or in a list of sequences at once."""
+        ignore = list(self.arity) + [","]
+        if isinstance(sequence, str):
+            return self.sampler.keep([sequence], keep, ignore)[0]
+        return self.sampler.keep(sequence, keep, ignore)
 
     def construct_primitives(self, token : str, n : int, include_letter : str="") -> List[Sample]:
-        primitives = []
-        for i in range(n):
-            source = [token]
-            if token in self.binary:
-                str1 = self._get_string(2, 5, include_letter)
-                str2 = self._get_string(2, 5, include_letter)
-                source = "{} {} , {}".format(token, str1, str2)
-            else:
-                str1 = self._get_string(2, 5, include_letter)
-                source = "{} {}".format(token, str1)
-            target, _, _ = self.get_target(source, None, None)
-            target = " ".join(target)
-            sample = Sample(source, target)
-            primitives.append(sample)
-        return primitives
-
-    def _unroll_recursively(self, sequence : str,
-                            output : Tuple[str, List[Tuple[str, str]], int],
+        """n samples applying `token' to random strings of two to five letters,
+        which are drawn in one batch. Their targets are computed by applying
+        the function directly, without parsing the sources."""
+        operation = getattr(self, "_" + self.functions[self.opcodes[token]])
+        strings = self.sampler.strings(n * self.arity[token], 2, 5, include_letter)
+        if self.arity[token] == 2:
+            return [Sample("{} {} , {}".format(token, str1, str2),
+                           " ".join(operation(str1.split(), str2.split())))
+                    for str1, str2 in zip(strings[::2], strings[1::2])]
+        return [Sample("{} {}".format(token, str1), " ".join(operation(str1.split())))
+                for str1 in strings]
+
+    def _close_argument(self, frames : List[Tuple[str, list]], argument):
+        """Attach a finished argument to the innermost open function call, and
+        close all calls that are complete. Returns the tree once the outermost
+        call is closed, None otherwise."""
+        while frames:
+            function, args = frames[-1]
+            args.append(argument)
+            if len(args) < self.arity[function]:
+                return None
+            frames.pop()
+            argument = Node(function, tuple(args))
+        return argument
+
+    def _count_functions(self, tree) -> int:
+        if not isinstance(tree, Node):
+            return 0
+        return 1 + sum(self._count_functions(arg) for arg in tree.args)
+
+    def _unroll_recursively(self, tree, output : List[Tuple[str, str]],
                             variable_counter : int) -> \
-                            (str, Tuple[str, List[Tuple[str, str]], int], int):
-        if sequence.count("(") > 1:
-            [function, rest] = sequence.split('(', 1)
-            function = function.lstrip().rstrip()
-            rest = rest.rsplit(')', 1)[0].lstrip().rstrip()
-            if function in self.binary:
-                arg1, arg2 = self._get_args(rest)
-                target1, output, variable_counter = self._unroll_recursively(arg1, output, variable_counter)
-                target2, output, variable_counter = self._unroll_recursively(arg2, output, variable_counter)
-                target3 = "*{}".format(variable_counter + 1)
-                output.append(("{} {} , {}".format(function, target1, target2), target3))
-                return target3, output, variable_counter + 1                  
-            else:
-                target1, output, variable_counter = self._unroll_recursively(rest, output, variable_counter)
-                target2 = "*{}".format(variable_counter + 1)
-                output.append(("{} {}".format(function, target1), target2))
-                return target2, output, variable_counter + 1
-        elif  sequence.count("(") == 1:
-            target = "*{}".format(variable_counter + 1)
-            sequence = sequence.replace("(", "")
-            sequence = sequence.replace(")", "")
-            sequence = re.sub("\ +", " ", sequence)
-            output.append((sequence, target))
-            return target, output, variable_counter + 1
-        else:
-            return sequence, output, variable_counter
-
-    def _get_target_recursively(self, sequence : str, token1 : str,
-                                token2 : str) -> str:
-        if "(" in sequence:
-            [function, rest] = sequence.split('(', 1)
-            function = function.lstrip().rstrip()
-            rest = rest.rsplit(')', 1)[0].lstrip().rstrip()
-            if function in self.binary:
-                arg1, arg2 = self._get_args(rest)
-                arg1, _, _ = self._get_target_recursively(arg1, token1, token2)
-                arg2, _, _ = self._get_target_recursively(arg2, token1, token2)
-                if function == token1 or function == token2:
-                    return getattr(self, "_" + self.replacements[function])(
-                            arg1, arg2
-                        ), token1, token2
-                else:
-                    return getattr(self, "_" + function)(arg1, arg2), token1, token2
-            else:
-                rest, _, _ = self._get_target_recursively(rest, token1, token2)
-                if function == token1 or function == token2:
-                    return getattr(self, "_" + self.replacements[function])(rest), token1, token2
-                else:
-                    return getattr(self, "_" + function)(rest), token1, token2
-        else:
-            return sequence.split(), token1, token2
-
-    def _get_args(self, sequence : str) -> bool:
-        brackets = 0
-        for i, character in enumerate(sequence):
-            if character == "," and brackets == 0:
-                return sequence[:i].strip(), sequence[i:].strip()[2:]
-            elif character == '(': brackets += 1
-            elif character == ')': brackets -= 1
-
-    def _place_brackets(self, seq):
-        seq = seq.split()
-        seq.append("END")
-        queue = []
-        new_seq = []
-
-        for token in seq:
-            if token in self.binary:
-                new_seq.append(token)
-                new_seq.append("(")
-                queue.append(["two", 0])
-            elif token in self.unary:
-                new_seq.append(token)
-                new_seq.append("(")
-                queue.append(["one", 0])
-            elif token == "," or token == "END":
-                while len(queue) > 0:
-                    if queue[-1][0] == "one":
-                        _ = queue.pop()
-                        new_seq.append(")")
-                    elif queue[-1][0] == "two" and queue[-1][1] == 0:
-                        queue[-1][1] = 1
-                        break
-                    elif queue[-1][0] == "two" and queue[-1][1] == 1:
-                        new_seq.append(")")
-                        _ = queue.pop()
-                if token == "," : new_seq.append(token)
-            else:
-                new_seq.append(token)
-
-        assert new_seq.count("(") == new_seq.count(")")
-        return " ".join(new_seq)
-
-    def _get_string(self, min_length, max_length, include_letter=""):
-        source = []
-        for j in range(random.randint(min_length, max_length)):
-            letter_index = random.randint(0, len(self.letters)-1)
-            letter = self.letters[letter_index]
-            source.append(letter)
-        if include_letter is not "":
-            source[random.randint(0, len(source)-1)] = include_letter
-        source = " ".join(source)
-        return source
+                            (str, List[Tuple[str, str]], int):
+        if not isinstance(tree, Node):
+            return " ".join(tree), output, variable_counter
+        args = []
+        for arg in tree.args:
+            target, output, variable_counter = self._unroll_recursively(arg, output, variable_counter)
+            args.append(target)
+        source = "{} {}".format(tree.function, " , ".join(args))
+        # Innermost calls keep the trailing space they always had in the
+        # unrolled datasets, so that generated files stay unchanged
+        if not any(isinstance(arg, Node) for arg in tree.args):
+            source += " "
+        target = "*{}".format(variable_counter + 1)
+        output.append((source, target))
+        return target, output, variable_counter + 1
+
+    def _compile_tree(self, tree, program : list, context : tuple) -> list:
+        if not isinstance(tree, Node):
+            program.append((None, tree))
+            return program
+        if self.cache.maxsize > 0:
+            # Entries are keyed by the hash of the subtree and hold the subtree
+            # itself, to tell apart subtrees with equal hashes
+            entry = self.cache.get((tree._hash, context))
+            if entry is not None and (entry[0] is tree or entry[0] == tree):
+                program.append((None, entry[1]))
+                return program
+        for arg in tree.args:
+            self._compile_tree(arg, program, context)
+        program.append((self.opcodes[tree.function], tree))
+        return program
+
+    def _context(self, token1 : str, token2 : str) -> tuple:
+        """Functions that are replaced when computing targets."""
+        return tuple(sorted(t for t in {token1, token2} if t in self.opcodes))
+
+    def _place_brackets(self, seq : str) -> str:
+        """Render a source sequence with brackets around function arguments."""
+        return self._format_brackets(self.parse(seq))
+
+    def _format_brackets(self, tree) -> str:
+        if not isinstance(tree, Node):
+            return " ".join(tree)
+        args = [self._format_brackets(arg) for arg in tree.args]
+        return "{} ( {} )".format(tree.function, " , ".join(args))
 
     # Unary functions
     def _copy(self, sequence):
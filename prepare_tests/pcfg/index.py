@@ -0,0 +1,94 @@
+import numpy as np
+
+from array import array
+from typing import Dict, Iterable, List
+
+
+class TokenIndex:
+    """
+    Inverted index over the source sequences of a list of samples, built in a
+    single pass. Samples are identified by their position in that list.
+
+    Attributes:
+        tokens: if given, only these tokens (and pairs of them) are indexed.
+        counts: per token, a dictionary from sample id to the number of times
+            the token occurs in that sample.
+        bigrams: per pair of adjacent tokens, the ascending ids of the samples
+            containing that pair.
+    """
+    def __init__(self, samples : Iterable, tokens : Iterable[str]=None):
+        self.tokens = set(tokens) if tokens is not None else None
+        self.counts = {}
+        self.bigrams = {}
+        for i, sample in enumerate(samples):
+            self.add(i, sample.source)
+
+    def add(self, i : int, sequence : str):
+        """Index the sequence of the sample with id i."""
+        tokens = sequence.split()
+        seen = set()
+        for position, token in enumerate(tokens):
+            if self.tokens is not None and token not in self.tokens: continue
+            postings = self.counts.setdefault(token, {})
+            postings[i] = postings.get(i, 0) + 1
+            if position + 1 == len(tokens): continue
+            bigram = (token, tokens[position + 1])
+            if bigram in seen: continue
+            if self.tokens is None or bigram[1] in self.tokens:
+                seen.add(bigram)
+                self.bigrams.setdefault(bigram, []).append(i)
+
+    def count(self, token : str, i : int) -> int:
+        """Number of occurrences of a token in the sample with id i."""
+        return self.counts.get(token, {}).get(i, 0)
+
+    def occurrences(self, token : str) -> Dict[int, int]:
+        """Ids of the samples containing a token, with their counts."""
+        return self.counts.get(token, {})
+
+    def lookup(self, token1 : str, token2 : str) -> List[int]:
+        """Ids of the samples in which token2 directly follows token1."""
+        return self.bigrams.get((token1, token2), [])
+
+
+class PresenceBitmaps:
+    """
+    Bitmaps recording which tokens occur in the source sequence of every sample,
+    packed in 64-bit words, so that samples with or without combinations of
+    tokens are selected with a few array operations.
+
+    Attributes:
+        tokens: the tokens that have a bit.
+        bits: the bit of every token.
+        matrix: array of shape (samples, words) with the presence bits.
+    """
+    def __init__(self, samples : Iterable, tokens : Iterable[str], n : int):
+        self.tokens = list(tokens)
+        self.bits = {t: i for i, t in enumerate(self.tokens)}
+        rows, columns = array("q"), array("q")
+        for i, sample in enumerate(samples):
+            for token in set(sample.source.split()):
+                if token in self.bits:
+                    rows.append(i)
+                    columns.append(self.bits[token])
+        self.matrix = np.zeros((n, (len(self.tokens) + 63) // 64), dtype=np.uint64)
+        columns = np.frombuffer(columns, dtype=np.int64)
+        np.bitwise_or.at(self.matrix, (np.frombuffer(rows, dtype=np.int64), columns // 64),
+                         np.left_shift(np.uint64(1), (columns % 64).astype(np.uint64)))
+
+    def mask(self, tokens : Iterable[str]) -> np.ndarray:
+        """Words with the bits of the given tokens set."""
+        mask = np.zeros(self.matrix.shape[1], dtype=np.uint64)
+        for token in tokens:
+            bit = self.bits[token]
+            mask[bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+        return mask
+
+    def contains_all(self, tokens : Iterable[str]) -> np.ndarray:
+        """Boolean array marking the samples that contain all tokens."""
+        mask = self.mask(tokens)
+        return ((self.matrix & mask) == mask).all(axis=1)
+
+    def contains_any(self, tokens : Iterable[str]) -> np.ndarray:
+        """Boolean array marking the samples that contain any of the tokens."""
+        return (self.matrix & self.mask(tokens)).any(axis=1)
@@ -5,19 +5,23 @@ import re
 import copy
 import json
 import random
+import itertools
 
-import handlers
-from dataset import Dataset, Sample
-
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Tuple
 
-def localism(handler : handlers.DatasetHandler, dataset : Dataset, name : str):
-    """Construct unrolled datasets for localism experiments."""
+import handlers
+from profiling import profiler
+from pipeline import generate
+from writer import SampleWriter
+from evaluation import VARIABLE
+from dataset import Dataset, Sample, open_text, save_samples
 
-    # Create new dataset containing the unrolled samples
-    unrolled_dataset = Dataset()
-    n = round(handler.percentage * len(dataset))
 
-    for sample in dataset[:n]:
+def unroll_samples(handler : handlers.DatasetHandler, samples : Iterable[Sample]) -> Iterator[Sample]:
+    """Unroll samples into the samples of a localism dataset."""
+    for sample in samples:
         # Primitive samples cannot be unrolled, as unrolled = original
         if handler.is_primitive(sample.source): continue
 
@@ -27,24 +31,179 @@ def localism(handler : handlers.DatasetHandler, dataset : Dataset, name : str):
         # Add `unrolled' or `original' to the samples to indicate the type
         # for the evaluation script
         for (source, target) in unrolled_samples[:-1]:
-            unrolled_dataset.add(Sample("unrolled\t{}".format(source), target))
-        unrolled_dataset.extend([
-            Sample("unrolled\t{}".format(unrolled_samples[-1][0]), sample.target),
-            Sample("original\t{}".format(sample.source), sample.target)
-        ])
+            yield Sample("unrolled\t{}".format(source), target)
+        yield Sample("unrolled\t{}".format(unrolled_samples[-1][0]), sample.target)
+        yield Sample("original\t{}".format(sample.source), sample.target)
+
+
+def unroll_samples_parallel(handler : handlers.DatasetHandler, samples : Iterable[Sample],
+                            workers : int, chunk_size : int=1000) -> Iterator[Sample]:
+    """Unroll chunks of samples in worker processes. Results are returned in
+    the order of the input, and at most two chunks per worker are in flight
+    at any time."""
+    samples = iter(samples)
+    chunks = iter(lambda: [Sample(s.source, s.target) for s in itertools.islice(samples, chunk_size)], [])
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(type(handler), handler.worker_settings())) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_unroll_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def deduplicate(handler : handlers.DatasetHandler, unrolled_samples : Iterable[Sample],
+                batch_size : int=1000) -> Iterator[Tuple[List[Sample], List[Sample]]]:
+    """Turn the samples of a localism dataset into a table of the unique
+    unrolled sub-expressions and the original samples referring to it, in
+    batches of (new table rows, original samples).
+
+    A table row holds `<id>\t<source>' and the target of the sub-expression,
+    where the variables in the source are replaced by `#<id>' of the rows
+    they stand for. An original sample holds `<id>\t<source>' with the id of
+    the row of its last unrolled step, and its target."""
+    ids = {}
+    rows, samples, steps = [], [], []
+    for sample in unrolled_samples:
+        kind, source = sample.source.split("\t", 1)
+        if kind == "unrolled":
+            steps.append(source)
+            continue
+        references, expanded = [], []
+        for step in steps:
+            tokens = step.split(" ")
+            key = " ".join("#{}".format(references[int(t[1:]) - 1]) if VARIABLE.match(t) else t
+                           for t in tokens)
+            # The sub-expression without variables, to compute its target
+            expanded.append(" ".join(expanded[int(t[1:]) - 1] if VARIABLE.match(t) else t
+                                     for t in tokens).strip())
+            if key not in ids:
+                ids[key] = len(ids)
+                rows.append((ids[key], key, expanded[-1]))
+            references.append(ids[key])
+        samples.append(Sample("{}\t{}".format(references[-1], source), sample.target))
+        steps = []
+        if len(samples) >= batch_size:
+            yield _table_rows(handler, rows), samples
+            rows, samples = [], []
+    if samples:
+        yield _table_rows(handler, rows), samples
+
+
+def _table_rows(handler : handlers.DatasetHandler, rows : List[Tuple[int, str, str]]) -> List[Sample]:
+    targets = handler.get_targets([expanded for _, _, expanded in rows])
+    return [Sample("{}\t{}".format(i, key), " ".join(target))
+            for (i, key, _), target in zip(rows, targets)]
+
+
+def expand_deduplicated(table : str, samples : str) -> Iterator[Sample]:
+    """Expand a deduplicated localism dataset, written as a table of
+    sub-expressions and original samples referring to it, back into the
+    unrolled and original samples of a localism dataset. The table is kept in
+    memory, the samples are streamed."""
+    sources = {}
+    with open_text(table) as f:
+        for line in f:
+            i, source, _ = line.rstrip("\n").split("\t")
+            sources["#" + i] = source
+
+    def unroll(reference : str, steps : List[str]) -> str:
+        # Variables are numbered in the order their steps are completed
+        tokens = sources[reference].split(" ")
+        source = " ".join(unroll(t, steps) if t in sources else t for t in tokens)
+        steps.append(source)
+        return "*{}".format(len(steps))
+
+    with open_text(samples) as f:
+        for line in f:
+            i, source, target = line.rstrip("\n").split("\t")
+            steps = []
+            unroll("#" + i, steps)
+            for j, step in enumerate(steps[:-1]):
+                yield Sample("unrolled\t{}".format(step), "*{}".format(j + 1))
+            yield Sample("unrolled\t{}".format(steps[-1]), target)
+            yield Sample("original\t{}".format(source), target)
 
-    # Save new dataset
+
+# Handler used by the unrolling in worker processes
+_worker_handler = None
+
+
+def _init_worker(handler_class : type, settings : Dict):
+    global _worker_handler
+    _worker_handler = handler_class.from_settings(settings)
+
+
+def _unroll_chunk(samples : List[Sample]) -> List[Sample]:
+    return list(unroll_samples(_worker_handler, samples))
+
+
+def localism(handler : handlers.DatasetHandler, dataset : Dataset, name : str,
+             workers : int=1):
+    """Construct unrolled datasets for localism experiments. Samples are
+    unrolled while the new dataset is written, so the dataset does not need to
+    fit in memory. With more than one worker, samples are unrolled by a pool
+    of processes; the output is the same. If the handler deduplicates, the
+    unique sub-expressions are saved as a table instead, see `deduplicate'."""
+    n = round(handler.percentage * len(dataset))
+    samples = itertools.islice(dataset, n)
+    if workers > 1:
+        unrolled_samples = unroll_samples_parallel(handler, samples, workers)
+    else:
+        unrolled_samples = unroll_samples(handler, samples)
+
+    # Save new dataset containing the unrolled samples
     directory = os.path.join(handler.output_dir, "localism")
+    if handler.deduplicate:
+        os.makedirs(directory, exist_ok=True)
+        table = os.path.join(directory, "subexpressions_{}.tsv".format(name))
+        filename = os.path.join(directory, "deduplicated_{}.tsv".format(name))
+        with profiler.stage("localism {}".format(name), n), \
+                SampleWriter(table) as f_table, SampleWriter(filename) as f_samples:
+            for rows, samples in deduplicate(handler, unrolled_samples):
+                f_table.write(rows)
+                f_samples.write(samples)
+        logging.info("Prepared deduplicated dataset, saved as {} with table {}.".format(filename, table))
+        return
     filename = "unrolled_{}.tsv".format(name)
-    unrolled_dataset.save(filename=filename, folder=directory)
+    with profiler.stage("localism {}".format(name), n):
+        save_samples(unrolled_samples, filename, directory)
     logging.info("Prepared unrolled dataset, saved as {}.".format(filename))
 
 
+def stages(config : Dict[str, Dict], seed : int=None) -> List[Tuple[str, List[str], List[str], int]]:
+    """(stage, inputs, outputs, seed) of every stage, for the artifact cache.
+    Unrolling does not depend on the seed."""
+    directory = os.path.join(config["general"]["output_dir"], "localism")
+    if config["localism"].get("deduplicate", False):
+        outputs = ["subexpressions_{}.tsv", "deduplicated_{}.tsv"]
+    else:
+        outputs = ["unrolled_{}.tsv"]
+    return [("localism " + name, [config["general"][name]],
+             [os.path.join(directory, f.format(name)) for f in outputs], None)
+            for name in ["train", "test"]]
+
+
+def run_stage(handler : handlers.DatasetHandler, stage : str, workers : int=1):
+    name = stage.split()[-1]
+    localism(handler, getattr(handler, name), name, workers)
+
+
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser()
     parser.add_argument('--config', type=str, default="config.json")
     parser.add_argument('--log_level', type=str, default="info")
+    parser.add_argument('--profile', type=str, nargs="?", const="profile.json", default=None,
+                        help="Save a profile of the run as JSON to this file.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of processes used to unroll samples.")
+    parser.add_argument('--force', action="store_true",
+                        help="Regenerate the outputs even if they are up to date.")
+    parser.add_argument('--expand', action="store_true",
+                        help="Expand deduplicated datasets into unrolled datasets, instead of generating them.")
     args = vars(parser.parse_args())
     logging.basicConfig(level=args["log_level"].upper(),
                         format='%(asctime)s - %(levelname)s - %(message)s')
@@ -55,13 +214,17 @@ if __name__ == '__main__':
         logging.error("Please enter an existing file for the training dataset.")
     elif not os.path.isfile(config["general"]["test"]):
         logging.error("Please enter an existing file for the testing dataset.")
+    elif args["expand"]:
+        directory = os.path.join(config["general"]["output_dir"], "localism")
+        for name in ["train", "test"]:
+            samples = expand_deduplicated(os.path.join(directory, "subexpressions_{}.tsv".format(name)),
+                                          os.path.join(directory, "deduplicated_{}.tsv".format(name)))
+            save_samples(samples, "unrolled_{}.tsv".format(name), directory)
+            logging.info("Expanded the deduplicated {} dataset.".format(name))
     else:
         print("Parameters\n----------")
         for k, v in config["localism"].items():
             print("{} : {}".format(k, v))
         print()
 
-        handler = getattr(handlers, config["general"]["handler"])
-        handler = handler(config=config, mode="localism")
-        localism(handler, handler.train, "train")
-        localism(handler, handler.test, "test")
\ No newline at end of file
+        generate(config, {"localism": (stages, run_stage)}, 1, args["workers"], args["force"], args["profile"])
@@ -0,0 +1,40 @@
+import logging
+import random
+
+from typing import Callable, Dict, Tuple
+
+import handlers
+from profiling import profiler
+from artifacts import ArtifactCache
+
+
+def generate(config : dict, tests : Dict[str, Tuple[Callable, Callable]], seed : int=1,
+             workers : int=1, force : bool=False, profile : str=None):
+    """Generate the datasets of tests, given the `stages' and `run_stage'
+    functions of every test, in the order they are run. The data is loaded
+    and its letters collected once, and the handler switches between the
+    settings of the tests. Stages whose outputs are up to date are skipped,
+    and nothing is loaded if all of them are."""
+    handler = getattr(handlers, config["general"]["handler"])
+    artifacts = ArtifactCache(config["general"]["output_dir"], enabled=not force)
+    pending = [(test, artifacts.pending(stages(config, seed), config[test], handler, config["general"]))
+               for test, (stages, _) in tests.items()]
+    pending = [(test, stages) for test, stages in pending if stages]
+    if not pending:
+        return
+
+    if profile: profiler.enable()
+    handler = handler(config=config, mode=pending[0][0])
+    profiler.count_calls(type(handler), handler.profiled_methods)
+    for test, stages in pending:
+        logging.info("Generating the {} datasets.".format(test))
+        handler.set_mode(config, test)
+        # Seed every test as if it was the only one
+        random.seed(seed)
+        handler.seed(seed)
+        with profiler.stage(test):
+            for stage, key, outputs in stages:
+                tests[test][1](handler, stage, workers)
+                artifacts.record(stage, key, outputs)
+    logging.info("Cache statistics: {}".format(handler.cache_info()))
+    if profile: profiler.save(profile)
@@ -0,0 +1,97 @@
+import json
+import time
+import resource
+import functools
+
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List
+
+
+class Profiler:
+    """
+    Opt-in instrumentation of test generation runs. Stages record their wall
+    time, the number of samples they processed and the peak resident set size
+    of the process at their end, and calls to selected methods are counted.
+    When the profiler is disabled, stages only cost a function call and no
+    methods are wrapped.
+
+    Attributes:
+        enabled: whether stages and calls are recorded.
+        stages: a record per finished stage.
+        calls: number of calls per counted method.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.stages = []
+        self.calls = Counter()
+        self._path = []
+        self._start = time.perf_counter()
+
+    def enable(self):
+        self.enabled = True
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name : str, samples : int=None):
+        """Record the stage run in the with-block. Stages can be nested, and
+        the number of samples can also be set on the yielded record."""
+        if not self.enabled:
+            yield {}
+            return
+        self._path.append(name)
+        record = {"name": name, "path": ";".join(self._path), "samples": samples}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            if record["samples"] is not None:
+                record["samples_per_second"] = record["samples"] / max(record["seconds"], 1e-9)
+            # ru_maxrss is in kilobytes on Linux
+            record["peak_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            self.stages.append(record)
+            self._path.pop()
+
+    def count_calls(self, cls : type, methods : List[str]):
+        """Count calls to methods of a class. Calls made in worker processes
+        are not counted."""
+        if not self.enabled:
+            return
+        for name in methods:
+            method = getattr(cls, name)
+
+            @functools.wraps(method)
+            def counted(*args, _method=method, _key="{}.{}".format(cls.__name__, name), **kwargs):
+                self.calls[_key] += 1
+                return _method(*args, **kwargs)
+            setattr(cls, name, counted)
+
+    def report(self) -> Dict:
+        return {
+            "seconds": time.perf_counter() - self._start,
+            "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            "stages": self.stages,
+            "calls": dict(self.calls)
+        }
+
+    def save(self, filename : str):
+        """Save the report as JSON, and the stages in the folded stack format
+        of flamegraph tools as `<filename>.folded', in microseconds."""
+        with open(filename, "w") as f:
+            json.dump(self.report(), f, indent=4)
+
+        # Flamegraphs need the time spent in a stage outside of its substages
+        own = Counter()
+        for record in self.stages:
+            own[record["path"]] += record["seconds"]
+            parent = record["path"].rpartition(";")[0]
+            if parent:
+                own[parent] -= record["seconds"]
+        with open(filename + ".folded", "w") as f:
+            for path, seconds in own.items():
+                f.write("{} {}\n".format(path, max(0, round(seconds * 1e6))))
+
+
+# Profiler shared by the handlers and the test generation scripts
+profiler = Profiler()
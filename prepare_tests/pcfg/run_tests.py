@@ -0,0 +1,61 @@
+import argparse
+import logging
+import os
+import json
+
+import localism
+import exceptions
+import substitutivity
+import systematicity
+from pipeline import generate
+
+
+# Module generating every compositionality test, in the order they are run
+TESTS = {
+    "localism": localism,
+    "exceptions": exceptions,
+    "substitutivity": substitutivity,
+    "systematicity": systematicity
+}
+
+
+def run_tests(config : dict, tests : list, seed : int=1, workers : int=1,
+              force : bool=False, profile : str=None):
+    """Generate the datasets of several tests in one process, see
+    pipeline.generate."""
+    generate(config, {test: (module.stages, module.run_stage) for test, module in TESTS.items()
+                      if test in tests}, seed, workers, force, profile)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', type=str, default="config.json")
+    parser.add_argument('--tests', type=str, nargs="+", choices=list(TESTS), default=list(TESTS),
+                        help="Tests to generate datasets for, by default all.")
+    parser.add_argument('--log_level', type=str, default="info")
+    parser.add_argument('--profile', type=str, nargs="?", const="profile.json", default=None,
+                        help="Save a profile of the run as JSON to this file.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of processes used to unroll samples.")
+    parser.add_argument('--force', action="store_true",
+                        help="Regenerate the outputs even if they are up to date.")
+    args = vars(parser.parse_args())
+    logging.basicConfig(level=args["log_level"].upper(),
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    with open(args["config"]) as f: config = json.load(f)
+
+    if not os.path.isfile(config["general"]["train"]):
+        logging.error("Please enter an existing file for the training dataset.")
+    elif not os.path.isfile(config["general"]["test"]):
+        logging.error("Please enter an existing file for the testing dataset.")
+    else:
+        print("Parameters\n----------")
+        for test in args["tests"]:
+            for k, v in config[test].items():
+                print("{} {} : {}".format(test, k, v))
+        print()
+
+        run_tests(config, args["tests"], args["seed"], args["workers"], args["force"], args["profile"])
@@ -0,0 +1,124 @@
+import itertools
+import math
+
+import numpy as np
+
+from typing import FrozenSet, Iterable, List, Sequence, Set
+
+
+class LetterSampler:
+    """
+    Seeded sampler of random letters, that draws whole batches of letter
+    strings and letter replacements at once with a NumPy Generator. Letters
+    are sorted, so that the samples only depend on the seed and not on the
+    order in which the letters were found.
+
+    Every sampler has its own stream of random numbers, derived from the seed
+    and a stream number, so that worker processes given different stream
+    numbers draw different but reproducible samples.
+
+    Attributes:
+        letters: sorted array of the letters to sample from.
+        index: position of every letter in `letters'.
+        seed_value: seed of the stream, None for fresh entropy.
+        stream: number of the stream.
+        rng: NumPy Generator of the stream.
+    """
+    def __init__(self, letters : Iterable[str], seed : int=None, stream : int=0):
+        self.letters = np.array(sorted(set(letters)), dtype=object)
+        self.index = {letter: i for i, letter in enumerate(self.letters)}
+        self._available = {}
+        self.seed(seed, stream)
+
+    def seed(self, seed : int=None, stream : int=0):
+        """Restart the sampler with the stream of a seed."""
+        self.seed_value = seed
+        self.stream = stream
+        self.rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(stream,)))
+
+    def spawn(self, stream : int) -> "LetterSampler":
+        """Sampler of the same letters with another stream of the same seed."""
+        return LetterSampler(self.letters, self.seed_value, stream)
+
+    def strings(self, n : int, min_length : int, max_length : int,
+                include_letter : str="") -> List[str]:
+        """Draw n strings of min_length to max_length letters separated by
+        spaces. If include_letter is given, it takes the place of one letter
+        of every string."""
+        table = self.letters
+        if include_letter and include_letter not in self.index:
+            table = np.append(table, np.array([include_letter], dtype=object))
+        lengths = self.rng.integers(min_length, max_length + 1, n)
+        strings = np.empty(n, dtype=object)
+        # Strings of the same length are drawn as one matrix of letter indices
+        for length in np.unique(lengths):
+            rows = np.flatnonzero(lengths == length)
+            indices = self.rng.integers(0, len(self.letters), (len(rows), length))
+            if include_letter:
+                position = self.rng.integers(0, length, len(rows))
+                indices[np.arange(len(rows)), position] = self.index.get(include_letter, len(table) - 1)
+            strings[rows] = list(map(" ".join, table[indices].tolist()))
+        return strings.tolist()
+
+    def replace(self, sequences : Sequence[str], replacements : Iterable[str]) -> List[str]:
+        """Replace every token of the sequences that is in `replacements' by a
+        random letter that is not."""
+        replacements = frozenset(replacements)
+        return self._substitute(sequences, replacements, True, self.available(replacements))
+
+    def keep(self, sequences : Sequence[str], keep : Sequence[str],
+             ignore : Iterable[str]=()) -> List[str]:
+        """Replace every token of the sequences that is not in `keep' or
+        `ignore' by a random letter of `keep'."""
+        return self._substitute(sequences, set(keep) | set(ignore), False,
+                                np.array(keep, dtype=object))
+
+    def available(self, replacements : FrozenSet[str]) -> np.ndarray:
+        """Letters that are not in `replacements', computed once per set."""
+        if replacements not in self._available:
+            self._available[replacements] = np.array(
+                [letter for letter in self.letters if letter not in replacements], dtype=object)
+        return self._available[replacements]
+
+    def _substitute(self, sequences : Sequence[str], tokens : Set[str], inside : bool,
+                    table : np.ndarray) -> List[str]:
+        """Replace the tokens that are in `tokens' if `inside', or not in it
+        otherwise, by letters drawn from `table' with one draw for all
+        sequences."""
+        if len(sequences) == 0:
+            return []
+        # Splitting one text is much faster than splitting every sequence
+        flat = " \n ".join(sequences).split(" ")
+        if inside:
+            positions = np.flatnonzero([token in tokens for token in flat])
+        else:
+            tokens = set(tokens) | {"", "\n"}
+            positions = np.flatnonzero([token not in tokens for token in flat])
+        letters = table[self.rng.integers(0, len(table), len(positions))].tolist()
+        for i, letter in zip(positions.tolist(), letters):
+            flat[i] = letter
+        return " ".join(flat).split(" \n ")
+
+
+def reservoir(items : Iterable, n : int, seed : int=None) -> list:
+    """Sample n items uniformly at random in one pass, with only the sampled
+    items in memory. With Algorithm L, random numbers are only drawn for items
+    that enter the reservoir, and the items in between are skipped. The items
+    are returned in the order of the input."""
+    rng = np.random.default_rng(seed)
+    items = iter(items)
+    sampled = list(itertools.islice(items, n))
+    positions = list(range(len(sampled)))
+    if 0 < n == len(sampled):
+        position = n - 1
+        weight = math.exp(math.log(1.0 - rng.random()) / n)
+        while True:
+            skip = math.floor(math.log(1.0 - rng.random()) / math.log(1.0 - weight))
+            item = next(itertools.islice(items, skip, None), None)
+            if item is None:
+                break
+            position += skip + 1
+            i = int(rng.integers(n))
+            sampled[i], positions[i] = item, position
+            weight *= math.exp(math.log(1.0 - rng.random()) / n)
+    return [sampled[i] for i in sorted(range(len(sampled)), key=positions.__getitem__)]
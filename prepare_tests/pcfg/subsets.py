@@ -0,0 +1,167 @@
+import argparse
+import itertools
+import logging
+import os
+import tempfile
+
+import numpy as np
+
+from typing import Callable, Iterable, Iterator, List, Tuple, Union
+from dataset import Sample, open_text, read_sample, save_samples
+from sampling import reservoir
+from writer import SampleWriter
+
+
+def read_samples(source : Union[str, Iterable[Sample]]) -> Iterator[Sample]:
+    """Stream the samples of a tab separated file, or of any iterable of
+    samples such as a LazyDataset."""
+    items, parse = _stream(source)
+    return map(parse, items)
+
+
+def _stream(source : Union[str, Iterable[Sample]]) -> Tuple[Iterator, Callable]:
+    """Items of a source and the function turning an item into a sample. The
+    lines of a file are only parsed when they are used."""
+    if isinstance(source, str):
+        def lines():
+            with open_text(source) as f:
+                yield from f
+        return lines(), read_sample
+    return iter(source), lambda sample: sample
+
+
+def reservoir_sample(source : Union[str, Iterable[Sample]], n : int, seed : int=None) -> List[Sample]:
+    """Sample n samples uniformly at random in one pass over a file or an
+    iterable of samples, see sampling.reservoir. The lines of a file that are
+    skipped are not parsed. The samples are returned in the order of the
+    input."""
+    items, parse = _stream(source)
+    return [parse(item) for item in reservoir(items, n, seed)]
+
+
+class ShuffledSamples:
+    """
+    Samples of a file or an iterable of samples in a uniformly random order,
+    shuffled on disk so that at most `chunk_size' samples are in memory.
+
+    The samples are read once, in chunks that are shuffled in memory and
+    written to temporary run files. Iterating merges the runs a block of
+    `chunk_size' samples at a time: the number of samples every run adds to
+    the block is drawn from a multivariate hypergeometric distribution, and
+    the order of the runs within the block by shuffling. That interleaves the
+    runs uniformly at random, so all orders of the samples are equally
+    likely. Every iteration gives the same order. Use it as a context
+    manager, or call `close' to remove the runs.
+
+    Attributes:
+        seed: seed of the order, drawn from fresh entropy if not given.
+        chunk_size: number of samples in memory at once.
+        runs: filenames of the shuffled runs.
+        sizes: number of samples per run.
+    """
+    def __init__(self, source : Union[str, Iterable[Sample]], seed : int=None,
+                 chunk_size : int=1000000, directory : str=None):
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+        self.chunk_size = chunk_size
+        self._directory = tempfile.TemporaryDirectory(dir=directory)
+        self.runs = []
+        self.sizes = []
+        rng = np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(0,)))
+        samples = read_samples(source)
+        for chunk in iter(lambda: list(itertools.islice(samples, chunk_size)), []):
+            run = os.path.join(self._directory.name, "run_{}.tsv".format(len(self.runs)))
+            with SampleWriter(run, sync=False) as writer:
+                writer.write(chunk[i] for i in rng.permutation(len(chunk)).tolist())
+            self.runs.append(run)
+            self.sizes.append(len(chunk))
+
+    def close(self):
+        self._directory.cleanup()
+
+    def __len__(self):
+        return sum(self.sizes)
+
+    def __iter__(self) -> Iterator[Sample]:
+        rng = np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(1,)))
+        files = [open_text(run) for run in self.runs]
+        try:
+            remaining = np.array(self.sizes, dtype=np.int64)
+            while remaining.sum() > 0:
+                counts = rng.multivariate_hypergeometric(remaining, min(self.chunk_size, int(remaining.sum())))
+                blocks = [iter(list(itertools.islice(f, count))) for f, count in zip(files, counts.tolist())]
+                labels = np.repeat(np.arange(len(files)), counts)
+                rng.shuffle(labels)
+                for label in labels.tolist():
+                    yield read_sample(next(blocks[label]))
+                remaining -= counts
+        finally:
+            for f in files:
+                f.close()
+
+    def __enter__(self) -> "ShuffledSamples":
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        self.close()
+
+
+def shuffle(source : Union[str, Iterable[Sample]], filename : str, seed : int=None,
+            chunk_size : int=1000000) -> int:
+    """Save the samples of a file or an iterable of samples in a random order,
+    shuffled on disk next to the output. Returns the number of samples."""
+    with ShuffledSamples(source, seed, chunk_size, os.path.dirname(os.path.abspath(filename))) as shuffled:
+        save_samples(shuffled, filename)
+        return len(shuffled)
+
+
+def split(source : Union[str, Iterable[Sample]], percentage : float, first : str, second : str,
+          seed : int=None, chunk_size : int=1000000) -> Tuple[int, int]:
+    """Split the samples of a file or an iterable of samples at random, saving
+    a percentage of them to `first' and the others to `second'. Returns the
+    number of samples in both files."""
+    with ShuffledSamples(source, seed, chunk_size, os.path.dirname(os.path.abspath(first))) as shuffled:
+        n = round(percentage * len(shuffled))
+        samples = iter(shuffled)
+        save_samples(itertools.islice(samples, n), first)
+        save_samples(samples, second)
+        return n, len(shuffled) - n
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description="Sample, shuffle or split tab separated datasets that do not need to fit in memory.")
+    parser.add_argument('action', choices=["sample", "shuffle", "split"])
+    parser.add_argument('-i', '--input', type=str, required=True, help="Input dataset.")
+    parser.add_argument('-o', '--output', type=str, nargs="+", required=True,
+                        help="Output dataset, or the two output datasets of a split.")
+    parser.add_argument('-n', type=int, default=None, help="Number of samples to sample.")
+    parser.add_argument('--percentage', type=float, default=None,
+                        help="Percentage of samples in the first output of a split.")
+    parser.add_argument('--chunk_size', type=int, default=1000000,
+                        help="Number of samples shuffled in memory at once.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log_level', type=str, default="info")
+    args = vars(parser.parse_args())
+    logging.basicConfig(level=args["log_level"].upper(),
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if not os.path.isfile(args["input"]):
+        logging.error("Please enter an existing input file.")
+    elif args["action"] == "sample":
+        if args["n"] is None:
+            logging.error("Please enter the number of samples to sample.")
+        else:
+            samples = reservoir_sample(args["input"], args["n"], args["seed"])
+            save_samples(samples, args["output"][0])
+            logging.info("Sampled {} samples to {}.".format(len(samples), args["output"][0]))
+    elif args["action"] == "shuffle":
+        n = shuffle(args["input"], args["output"][0], args["seed"], args["chunk_size"])
+        logging.info("Shuffled {} samples to {}.".format(n, args["output"][0]))
+    elif args["percentage"] is None or len(args["output"]) != 2:
+        logging.error("Please enter a percentage and two output files.")
+    else:
+        n = split(args["input"], args["percentage"], args["output"][0], args["output"][1],
+                  args["seed"], args["chunk_size"])
+        logging.info("Split into {} samples in {} and {} in {}.".format(
+            n[0], args["output"][0], n[1], args["output"][1]))
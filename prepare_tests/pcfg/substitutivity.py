@@ -0,0 +1,95 @@
+import argparse
+import logging
+import os
+import json
+import random
+
+from typing import Dict, Iterator, List, Set, Tuple
+
+from profiling import profiler
+from pipeline import generate
+from handlers import DatasetHandler
+from dataset import Dataset, Sample, save_samples
+from index import TokenIndex
+
+
+def substitutivity(handler : DatasetHandler, dataset : Dataset, test : Dataset):
+    """Construct datasets for substitutivity experiments. In the training set,
+    a percentage of the samples containing a candidate get the candidate's
+    synonym instead. Test samples containing candidates are saved both as is
+    and with all candidates replaced by their synonyms."""
+
+    def substitute(sequence : str, candidates : Set[str]) -> str:
+        return " ".join(handler.synonyms[t] if t in candidates else t for t in sequence.split())
+
+    def substitute_train(substitutions : Dict[int, Set[str]]) -> Iterator[Sample]:
+        for i, sample in enumerate(dataset):
+            if i in substitutions:
+                sample = Sample(substitute(sample.source, substitutions[i]), sample.target)
+            yield sample
+
+    def substitute_test() -> Iterator[Sample]:
+        # Add `original' or `synonym' to the samples to indicate the type
+        # for the evaluation script
+        candidates = set(handler.candidates)
+        for sample in test:
+            if candidates.isdisjoint(sample.source.split()): continue
+            yield Sample("original\t{}".format(sample.source), sample.target)
+            yield Sample("synonym\t{}".format(substitute(sample.source, candidates)), sample.target)
+
+    # Find the samples containing every candidate with one pass over the data
+    with profiler.stage("index", len(dataset)):
+        index = TokenIndex(dataset, tokens=handler.candidates)
+    substitutions = {}
+    for candidate in handler.candidates:
+        ids = list(index.occurrences(candidate))
+        n = round(handler.percentage * len(ids))
+        logging.info("Substituting {} in {} of {} samples.".format(candidate, n, len(ids)))
+        for i in random.sample(ids, n):
+            substitutions.setdefault(i, set()).add(candidate)
+
+    directory = os.path.join(handler.output_dir, "substitutivity/")
+    with profiler.stage("save", len(dataset) + len(test)):
+        save_samples(substitute_train(substitutions), "train.tsv", directory)
+        save_samples(substitute_test(), "test.tsv", directory)
+    logging.info("Prepared substitutivity datasets in {}.".format(directory))
+
+
+def stages(config : Dict[str, Dict], seed : int=None) -> List[Tuple[str, List[str], List[str], int]]:
+    """(stage, inputs, outputs, seed) of every stage, for the artifact cache."""
+    directory = os.path.join(config["general"]["output_dir"], "substitutivity")
+    return [("substitutivity", [config["general"]["train"], config["general"]["test"]],
+             [os.path.join(directory, f) for f in ["train.tsv", "test.tsv"]], seed)]
+
+
+def run_stage(handler : DatasetHandler, stage : str, workers : int=1):
+    substitutivity(handler, handler.train, handler.test)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', type=str, default="config.json")
+    parser.add_argument('--log_level', type=str, default="info")
+    parser.add_argument('--profile', type=str, nargs="?", const="profile.json", default=None,
+                        help="Save a profile of the run as JSON to this file.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--force', action="store_true",
+                        help="Regenerate the outputs even if they are up to date.")
+    args = vars(parser.parse_args())
+    logging.basicConfig(level=args["log_level"].upper(),
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    with open(args["config"]) as f: config = json.load(f)
+
+    if not os.path.isfile(config["general"]["train"]):
+        logging.error("Please enter an existing file for the training dataset.")
+    elif not os.path.isfile(config["general"]["test"]):
+        logging.error("Please enter an existing file for the testing dataset.")
+    else:
+        print("Parameters\n----------")
+        for k, v in config["substitutivity"].items():
+            print("{} : {}".format(k, v))
+        print()
+
+        generate(config, {"substitutivity": (stages, run_stage)}, args["seed"], 1, args["force"], args["profile"])
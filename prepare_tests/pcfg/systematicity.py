@@ -0,0 +1,83 @@
+import argparse
+import logging
+import os
+import json
+import random
+import itertools
+
+from typing import Dict, List, Tuple
+
+from profiling import profiler
+from pipeline import generate
+from handlers import DatasetHandler
+from dataset import Dataset, save_samples
+from index import PresenceBitmaps
+
+
+def systematicity(handler : DatasetHandler, dataset : Dataset, test : Dataset):
+    """Construct datasets for systematicity experiments. For every candidate
+    function, a percentage of the letters is held out in combination with that
+    function: samples in which both occur form the test set, all other samples
+    of the training and testing data form the training set."""
+    n = len(dataset) + len(test)
+    with profiler.stage("bitmaps", n):
+        functions = PresenceBitmaps(itertools.chain(dataset, test), handler.functions, n)
+        letters = PresenceBitmaps(itertools.chain(dataset, test), handler.letters, n)
+    n_letters = max(1, round(handler.percentage * len(handler.letters)))
+
+    for candidate in handler.candidates:
+        # The order of the letters depends on string hashing, sort them so
+        # that the seed determines the held out letters
+        held_out = random.sample(sorted(handler.letters), n_letters)
+        in_test = functions.contains_all([candidate]) & letters.contains_any(held_out)
+        logging.info("Holding out {} with {}: {} test samples.".format(
+            candidate, " ".join(held_out), int(in_test.sum())))
+
+        directory = os.path.join(handler.output_dir, "systematicity", candidate)
+        os.makedirs(directory, exist_ok=True)
+        with profiler.stage("save {}".format(candidate), n):
+            samples = itertools.chain(dataset, test)
+            save_samples(itertools.compress(samples, ~in_test), "train.tsv", directory)
+            samples = itertools.chain(dataset, test)
+            save_samples(itertools.compress(samples, in_test), "test.tsv", directory)
+
+
+def stages(config : Dict[str, Dict], seed : int=None) -> List[Tuple[str, List[str], List[str], int]]:
+    """(stage, inputs, outputs, seed) of every stage, for the artifact cache."""
+    directory = os.path.join(config["general"]["output_dir"], "systematicity")
+    return [("systematicity", [config["general"]["train"], config["general"]["test"]],
+             [os.path.join(directory, c, f) for c in config["systematicity"]["candidates"]
+              for f in ["train.tsv", "test.tsv"]], seed)]
+
+
+def run_stage(handler : DatasetHandler, stage : str, workers : int=1):
+    systematicity(handler, handler.train, handler.test)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', type=str, default="config.json")
+    parser.add_argument('--log_level', type=str, default="info")
+    parser.add_argument('--profile', type=str, nargs="?", const="profile.json", default=None,
+                        help="Save a profile of the run as JSON to this file.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--force', action="store_true",
+                        help="Regenerate the outputs even if they are up to date.")
+    args = vars(parser.parse_args())
+    logging.basicConfig(level=args["log_level"].upper(),
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    with open(args["config"]) as f: config = json.load(f)
+
+    if not os.path.isfile(config["general"]["train"]):
+        logging.error("Please enter an existing file for the training dataset.")
+    elif not os.path.isfile(config["general"]["test"]):
+        logging.error("Please enter an existing file for the testing dataset.")
+    else:
+        print("Parameters\n----------")
+        for k, v in config["systematicity"].items():
+            print("{} : {}".format(k, v))
+        print()
+
+        generate(config, {"systematicity": (stages, run_stage)}, args["seed"], 1, args["force"], args["profile"])
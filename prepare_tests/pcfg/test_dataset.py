@@ -0,0 +1,154 @@
+import os
+
+from array import array
+
+import numpy as np
+import pytest
+
+from conftest import pairs
+from dataset import CompactDataset, Dataset, LazyDataset, Sample, load_binary, load_cached_binary, save_samples
+
+
+SAMPLES = [
+    Sample("append A1 B2 , C3", "A1 B2 C3"),
+    Sample("reverse A1 B2", "B2 A1"),
+    Sample("copy Z20", "Z20"),
+    Sample("append A1 B2 , C3", "A1 B2 C3"),
+]
+
+
+def test_binary_round_trip(tmp_path):
+    filename = str(tmp_path / "data.npz")
+    save_samples(SAMPLES, filename)
+    dataset = Dataset(filename=filename)
+    assert pairs(dataset) == pairs(SAMPLES)
+    assert dataset.statistics == Dataset(samples=SAMPLES).statistics
+    assert pairs(CompactDataset(filename)) == pairs(SAMPLES)
+
+
+def test_cached_binary_round_trip(tsv):
+    assert pairs(Dataset(filename=tsv, cache=True)) == pairs(SAMPLES)
+    # The second load maps the cached copy
+    assert pairs(Dataset(filename=tsv, cache=True)) == pairs(SAMPLES)
+    assert load_binary(tsv + ".npz")["checksum"].size > 0
+
+
+@pytest.mark.parametrize("corrupt", [
+    lambda data: data[:len(data) // 2],
+    lambda data: b"garbage" * 10,
+    lambda data: b"",
+])
+def test_corrupt_cache_is_rebuilt(tsv, corrupt):
+    load_cached_binary(tsv)
+    with open(tsv + ".npz", "rb") as f:
+        data = f.read()
+    with open(tsv + ".npz", "wb") as f:
+        f.write(corrupt(data))
+    assert pairs(Dataset(filename=tsv, cache=True)) == pairs(SAMPLES)
+    assert pairs(Dataset(filename=tsv + ".npz")) == pairs(SAMPLES)
+
+
+def test_cache_is_rebuilt_when_source_changes(tsv):
+    load_cached_binary(tsv)
+    save_samples(SAMPLES[:2], tsv)
+    assert pairs(Dataset(filename=tsv, cache=True)) == pairs(SAMPLES[:2])
+
+
+def test_compressed_archive_is_rejected(tmp_path, tsv):
+    filename = str(tmp_path / "compressed.npz")
+    np.savez_compressed(filename, vocabulary=np.zeros(3, dtype=np.uint8))
+    with pytest.raises(ValueError):
+        load_binary(filename)
+
+    # A compressed cache is replaced by an uncompressed copy
+    arrays = {name: np.array(array) for name, array in load_cached_binary(tsv).items()}
+    np.savez_compressed(tsv + ".npz", **arrays)
+    assert pairs(Dataset(filename=tsv, cache=True)) == pairs(SAMPLES)
+    load_binary(tsv + ".npz")
+
+
+@pytest.mark.parametrize("truncate", [
+    lambda data: data[:len(data) // 2],
+    lambda data: data[:-8],
+    lambda data: data[:24],
+    lambda data: b"",
+])
+def test_truncated_offsets_are_rebuilt(tsv, truncate):
+    LazyDataset(tsv).close()
+    with open(tsv + ".offsets", "rb") as f:
+        data = f.read()
+    with open(tsv + ".offsets", "wb") as f:
+        f.write(truncate(data))
+    dataset = LazyDataset(tsv)
+    assert pairs(dataset) == pairs(SAMPLES)
+    dataset.close()
+    with open(tsv + ".offsets", "rb") as f:
+        assert f.read() == data
+
+
+def test_offsets_without_count_are_rebuilt(tmp_path):
+    filename = str(tmp_path / "line.tsv")
+    save_samples(SAMPLES[:1], filename)
+    stat = os.stat(filename)
+    # The cache format without the number of offsets
+    with open(filename + ".offsets", "wb") as f:
+        array("q", [stat.st_size, stat.st_mtime_ns, 0]).tofile(f)
+    assert pairs(LazyDataset(filename)) == pairs(SAMPLES[:1])
+
+
+def test_binary_keeps_whitespace(tmp_path):
+    samples = SAMPLES + [Sample("a  b ", " a b"), Sample("copy X", "y  z")]
+    filename = str(tmp_path / "spaces.tsv")
+    save_samples(samples, filename)
+    assert pairs(Dataset(filename=filename, cache=True)) == pairs(Dataset(filename=filename))
+    save_samples(samples, filename + ".npz")
+    assert pairs(Dataset(filename=filename + ".npz")) == pairs(samples)
+    # A CompactDataset has single spaces between tokens
+    assert pairs(CompactDataset(filename + ".npz"))[-2:] == [("a b", "a b"), ("copy X", "y z")]
+
+
+def test_views_of_views_refer_to_the_parent():
+    dataset = Dataset(samples=SAMPLES)
+    view = dataset.select([0, 2, 3])
+    inner = view.select([2, 1])
+    assert inner._parent is dataset
+    assert list(inner._positions) == [3, 2]
+    assert pairs(inner) == pairs([SAMPLES[3], SAMPLES[2]])
+    assert inner[0] is dataset[3]
+    assert pairs(view.filter(lambda s: s.source.startswith("append"))) == pairs([SAMPLES[0], SAMPLES[3]])
+
+
+def test_view_copies_on_write():
+    dataset = Dataset(samples=SAMPLES)
+    view = dataset.select([1, 2])
+    view.add(Sample("copy Y1", "Y1"))
+    view.remove([SAMPLES[1]])
+    assert view._parent is None
+    assert pairs(view) == [("copy Z20", "Z20"), ("copy Y1", "Y1")]
+    assert view.statistics == Dataset(samples=view).statistics
+    assert "copy Y1" in view and "reverse A1 B2" not in view
+    # The parent is not changed
+    assert pairs(dataset) == pairs(SAMPLES)
+    assert dataset.statistics == Dataset(samples=SAMPLES).statistics
+
+
+def test_view_statistics_are_lazy():
+    dataset = Dataset(samples=SAMPLES)
+    view = dataset.select([0, 1])
+    assert view._statistics is None
+    assert view.statistics == Dataset(samples=SAMPLES[:2]).statistics
+    # Statistics computed before a copy are kept
+    statistics = view.statistics
+    view.extend([Sample("copy A1", "A1")])
+    assert view.statistics == Dataset(samples=SAMPLES[:2] + [Sample("copy A1", "A1")]).statistics
+    assert statistics is view.statistics
+
+
+def test_filter_skips_removed_samples():
+    dataset = Dataset(samples=SAMPLES)
+    dataset.remove([SAMPLES[0], SAMPLES[2]])
+    view = dataset.filter(lambda s: "A1" in s.source)
+    # Positions are taken after the holes left by removals are compacted
+    assert pairs(view) == pairs([SAMPLES[1], SAMPLES[3]])
+    assert view[1] is SAMPLES[3]
+    assert len(view) == 2
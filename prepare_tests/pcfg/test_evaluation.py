@@ -0,0 +1,86 @@
+import pytest
+
+from evaluation import Scores, evaluate, read_rows
+
+
+LOCALISM = [
+    "unrolled\treverse A B\t*1",
+    "unrolled\tappend *1 , C\tB A C",
+    "original\tappend reverse A B , C\tB A C",
+    "unrolled\treverse D E\t*1",
+    "unrolled\techo *1\t*2",
+    "unrolled\tcopy *2\tE D D",
+    "original\tcopy echo reverse D E\tE D D",
+]
+
+SUBSTITUTIVITY = [
+    "original\treverse A B\tB A",
+    "synonym\treverse_syn A B\tB A",
+    "original\tcopy C\tC",
+    "synonym\tcopy_syn C\tC",
+]
+
+
+def write(tmp_path, name, lines):
+    filename = str(tmp_path / name)
+    with open(filename, "w") as f:
+        f.write("".join(line + "\n" for line in lines))
+    return filename
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 10000])
+def test_localism_chains(tmp_path, batch_size):
+    test = write(tmp_path, "test.tsv", LOCALISM)
+    # The steps may predict variables or the tokens they stand for
+    predictions = write(tmp_path, "test.tsv.pred", [
+        "B A", "B A C", "B A C",
+        "E D", "*1 D", "*2", "E D E",
+    ])
+    scores = evaluate("localism", test, predictions, batch_size)
+    # Only the last steps and the originals are scored, as they are predicted
+    assert scores.samples == 4
+    assert scores.correct == 2
+    # The first chain gives B A C, the second E D D instead of E D E
+    assert scores.groups == 2
+    assert scores.consistent == 1
+    assert scores.summary()["consistency"] == 0.5
+
+
+def test_substitutivity_pairs(tmp_path):
+    test = write(tmp_path, "test.tsv", SUBSTITUTIVITY)
+    predictions = write(tmp_path, "test.tsv.pred", ["B A", "B  A ", "C", "D"])
+    scores = evaluate("substitutivity", test, predictions, batch_size=3)
+    assert scores.samples == 4
+    assert scores.exact == 2
+    assert scores.correct == 3
+    assert (scores.groups, scores.consistent) == (2, 1)
+
+
+def test_scores_without_groups(tmp_path):
+    test = write(tmp_path, "test.tsv", ["copy A B\tA B", "reverse A B\tB A"])
+    predictions = write(tmp_path, "test.tsv.pred", ["A B", "B"])
+    assert [row[0] for row in next(read_rows(test, predictions, 10))] == ["", ""]
+    summary = evaluate("systematicity", test, predictions).summary()
+    assert "consistency" not in summary
+    assert summary["sequence_accuracy"] == 0.5
+    # Positions are counted over the longer of target and prediction
+    assert summary["token_accuracy"] == 0.75
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 10000])
+def test_prediction_lengths(tmp_path, batch_size):
+    test = write(tmp_path, "test.tsv", SUBSTITUTIVITY)
+    fewer = write(tmp_path, "fewer.pred", ["B A", "B A", "C"])
+    more = write(tmp_path, "more.pred", ["B A", "B A", "C", "C", "C"])
+    with pytest.raises(ValueError, match="fewer"):
+        evaluate("substitutivity", test, fewer, batch_size)
+    with pytest.raises(ValueError, match="more"):
+        evaluate("substitutivity", test, more, batch_size)
+    # A trailing empty line is not a prediction
+    empty = write(tmp_path, "empty.pred", ["B A", "B A", "C", "C", ""])
+    assert evaluate("substitutivity", test, empty, batch_size).samples == 4
+
+
+def test_empty_scores():
+    assert Scores().summary() == {"samples": 0, "exact_match": 0.0,
+                                  "sequence_accuracy": 0.0, "token_accuracy": 0.0}
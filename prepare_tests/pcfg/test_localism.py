@@ -0,0 +1,66 @@
+import pytest
+
+from dataset import Dataset, Sample, save_samples
+from handlers import PCFGHandler
+from localism import deduplicate, expand_deduplicated, localism, unroll_samples
+
+
+SOURCES = [
+    "append reverse A1 B2 , C3",
+    "prepend reverse A1 B2 , echo reverse A1 B2",
+    "copy A1",
+    "remove_first echo reverse A1 B2 , swap_first_last append reverse A1 B2 , C3",
+    "append reverse A1 B2 , C3",
+    "repeat shift D4 E5 F6",
+]
+
+
+@pytest.fixture
+def handler(tmp_path):
+    handler = PCFGHandler({"general": {"train": _tsv(tmp_path, "train.tsv", SOURCES),
+                                       "test": _tsv(tmp_path, "test.tsv", SOURCES[:2]),
+                                       "output_dir": str(tmp_path)},
+                           "localism": {"percentage": 1.0}}, "localism")
+    # Replace the placeholder targets by the computed ones
+    for name in ["train", "test"]:
+        dataset = getattr(handler, name)
+        targets = handler.get_targets([s.source for s in dataset])
+        setattr(handler, name, Dataset(samples=[Sample(s.source, " ".join(t))
+                                                for s, t in zip(dataset, targets)]))
+    return handler
+
+
+def _tsv(tmp_path, name, sources):
+    filename = str(tmp_path / name)
+    save_samples([Sample(source, "?") for source in sources], filename)
+    return filename
+
+
+def test_deduplicated_table_is_unique(handler):
+    batches = list(deduplicate(handler, unroll_samples(handler, handler.train), batch_size=2))
+    assert len(batches) == 3
+    rows = [row.source.split("\t")[1].strip() for table, _ in batches for row in table]
+    samples = [sample for _, batch in batches for sample in batch]
+    # Every sub-expression is in the table once, even across batches, and
+    # the primitive sample is not unrolled
+    assert len(set(rows)) == len(rows) == 8
+    assert rows.count("reverse A1 B2") == 1
+    assert len(samples) == 5
+    assert samples[0].source == samples[3].source == "1\tappend reverse A1 B2 , C3"
+    assert batches[0][0][1].target == "B2 A1 C3"
+
+
+@pytest.mark.parametrize("name", ["train", "test"])
+def test_expand_gives_unrolled_dataset(tmp_path, handler, name):
+    handler.deduplicate = False
+    localism(handler, getattr(handler, name), name)
+    handler.deduplicate = True
+    localism(handler, getattr(handler, name), name)
+
+    directory = tmp_path / "localism"
+    expanded = str(directory / "expanded_{}.tsv".format(name))
+    save_samples(expand_deduplicated(str(directory / "subexpressions_{}.tsv".format(name)),
+                                     str(directory / "deduplicated_{}.tsv".format(name))), expanded)
+    with open(expanded, "rb") as f_expanded, \
+            open(str(directory / "unrolled_{}.tsv".format(name)), "rb") as f_unrolled:
+        assert f_expanded.read() == f_unrolled.read()
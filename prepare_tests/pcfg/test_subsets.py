@@ -0,0 +1,89 @@
+import collections
+
+import pytest
+
+from conftest import pairs
+from dataset import CompactDataset, Dataset, LazyDataset, Sample
+from subsets import ShuffledSamples, reservoir_sample, shuffle, split
+
+
+SAMPLES = [Sample("copy A{}".format(i), "A{}".format(i)) for i in range(1, 101)]
+
+
+def test_shuffle_is_permutation_over_several_runs(tsv):
+    with ShuffledSamples(tsv, seed=1, chunk_size=7) as shuffled:
+        assert len(shuffled.runs) == 15
+        assert len(shuffled) == len(SAMPLES)
+        order = pairs(shuffled)
+        assert sorted(order) == sorted(pairs(SAMPLES))
+        assert order != pairs(SAMPLES)
+        # Every iteration gives the same order
+        assert pairs(shuffled) == order
+
+
+def test_shuffle_is_seeded(tsv):
+    with ShuffledSamples(tsv, seed=1, chunk_size=7) as first, \
+            ShuffledSamples(LazyDataset(tsv), seed=1, chunk_size=7) as second, \
+            ShuffledSamples(tsv, seed=2, chunk_size=7) as third:
+        assert pairs(first) == pairs(second)
+        assert pairs(first) != pairs(third)
+
+
+def test_shuffle_is_uniform():
+    # Every sample is equally likely to come first, also across runs
+    samples = SAMPLES[:6]
+    counts = collections.Counter()
+    for seed in range(3000):
+        with ShuffledSamples(samples, seed=seed, chunk_size=4) as shuffled:
+            counts[next(iter(shuffled)).source] += 1
+    assert len(counts) == 6
+    assert all(400 < count < 600 for count in counts.values())
+
+
+def test_shuffle_and_split_files(tmp_path, tsv):
+    output = str(tmp_path / "shuffled.tsv.gz")
+    assert shuffle(tsv, output, seed=1, chunk_size=10) == len(SAMPLES)
+    assert sorted(pairs(Dataset(filename=output))) == sorted(pairs(SAMPLES))
+
+    first, second = str(tmp_path / "first.tsv"), str(tmp_path / "second.tsv")
+    assert split(tsv, 0.3, first, second, seed=1, chunk_size=10) == (30, 70)
+    assert sorted(pairs(Dataset(filename=first)) + pairs(Dataset(filename=second))) == \
+        sorted(pairs(SAMPLES))
+    assert sorted(tmp_path.iterdir()) == sorted(
+        tmp_path / name for name in ["data.tsv", "shuffled.tsv.gz", "first.tsv", "second.tsv"])
+
+
+def test_reservoir_sample(tsv):
+    sampled = pairs(reservoir_sample(tsv, 10, seed=1))
+    assert len(set(sampled)) == 10
+    # Samples keep the order of the input
+    assert sampled == [pair for pair in pairs(SAMPLES) if pair in sampled]
+    assert pairs(reservoir_sample(LazyDataset(tsv), 10, seed=1)) == sampled
+    assert pairs(reservoir_sample(tsv, 1000, seed=1)) == pairs(SAMPLES)
+    assert reservoir_sample(tsv, 0, seed=1) == []
+
+
+def test_reservoir_sample_is_uniform():
+    counts = collections.Counter()
+    for seed in range(2000):
+        counts.update(s.source for s in reservoir_sample(SAMPLES[:10], 3, seed))
+    assert len(counts) == 10
+    assert all(500 < count < 700 for count in counts.values())
+
+
+@pytest.mark.parametrize("load", [
+    lambda tsv: Dataset(filename=tsv),
+    lambda tsv: LazyDataset(tsv),
+    lambda tsv: CompactDataset(tsv),
+    lambda tsv: Dataset(filename=tsv).select(range(0, 100, 2)),
+])
+def test_keep_top(tsv, load):
+    dataset = load(tsv)
+    before = pairs(dataset)
+    dataset.keep_top(10, seed=1)
+    kept = pairs(dataset)
+    assert len(kept) == 10 and len(set(kept)) == 10
+    assert set(kept) <= set(before)
+    other = load(tsv)
+    other.keep_top(10, seed=1)
+    assert pairs(other) == kept
@@ -0,0 +1,113 @@
+import os
+import gzip
+import queue
+import itertools
+import threading
+
+from typing import Iterable
+
+
+# Number of bytes buffered by the output file
+BUFFER_SIZE = 1 << 20
+# Level 6 compresses nearly as well as the default 9, but much faster
+GZIP_LEVEL = 6
+
+
+class SampleWriter:
+    """
+    Writer of samples with source and target separated by a tab per line.
+    Samples are formatted in batches by the thread that writes them, and the
+    batches are written to disk by a background thread, so that generating
+    samples overlaps with writing them. The queue between the threads holds
+    at most `queue_size' batches, which bounds the memory used when the disk
+    is slower than the generation.
+
+    Files whose name ends with .gz are compressed. The samples are written to
+    `<filename>.tmp', which only replaces `filename' once all samples are
+    written and synced to disk, so that an interrupted run or a crash never
+    leaves a partial file. Use the writer as a context manager, or call
+    `close' when done.
+
+    Attributes:
+        filename: file the samples end up in.
+        batch_size: number of samples formatted and queued at once.
+        sync: whether to sync the file to disk, which temporary files do not
+            need.
+    """
+    def __init__(self, filename : str, batch_size : int=10000, queue_size : int=8,
+                 sync : bool=True):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.sync = sync
+        self._temporary = filename + ".tmp"
+        self._queue = queue.Queue(queue_size)
+        self._error = None
+        self._raw = open(self._temporary, "wb", buffering=BUFFER_SIZE)
+        self._file = self._raw
+        if filename.endswith(".gz"):
+            # Without a timestamp equal samples give equal files
+            self._file = gzip.GzipFile(os.path.basename(filename[:-len(".gz")]), "wb", GZIP_LEVEL,
+                                       self._raw, mtime=0)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, samples : Iterable):
+        """Queue samples to be written, formatting them a batch at a time."""
+        samples = iter(samples)
+        for batch in iter(lambda: list(itertools.islice(samples, self.batch_size)), []):
+            if self._error is not None:
+                break
+            lines = "".join(["{}\t{}\n".format(s.source, s.target) for s in batch])
+            # Compressing and writing release the lock of the interpreter, so
+            # the background thread only does that
+            self._queue.put(lines.encode("utf-8"))
+
+    def close(self, commit : bool=True):
+        """Wait until all queued samples are written and move the file in
+        place, or remove it if `commit' is False or writing failed."""
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            if self._file is not self._raw:
+                self._file.close()
+            if commit and self._error is None and self.sync:
+                # The data must be on disk before the rename is, or a crash
+                # could leave an empty or truncated file under the new name
+                self._raw.flush()
+                os.fsync(self._raw.fileno())
+            self._raw.close()
+        except OSError as error:
+            self._error = self._error or error
+        if commit and self._error is None:
+            os.replace(self._temporary, self.filename)
+            if self.sync:
+                _fsync_directory(os.path.dirname(os.path.abspath(self.filename)))
+            return
+        os.remove(self._temporary)
+        if commit:
+            raise self._error
+
+    def _run(self):
+        try:
+            for block in iter(self._queue.get, None):
+                self._file.write(block)
+        except Exception as error:
+            self._error = error
+            # Keep taking batches, so that the writing thread never blocks
+            for _ in iter(self._queue.get, None):
+                pass
+
+    def __enter__(self) -> "SampleWriter":
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        self.close(commit=kind is None)
+
+
+def _fsync_directory(directory : str):
+    """Make a rename in a directory durable."""
+    descriptor = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
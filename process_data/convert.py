@@ -0,0 +1,172 @@
+import argparse
+import os
+import io
+import gzip
+import logging
+import itertools
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+
+# Number of bytes buffered per file, and of lines converted at once
+BUFFER_SIZE = 1 << 22
+BLOCK_SIZE = 1 << 16
+# Level 6 compresses nearly as well as the default 9, but much faster
+GZIP_LEVEL = 6
+
+
+def open_file(filename : str, mode : str="r"):
+    """Open a UTF-8 text file with a large buffer, through gzip if the name
+    ends with .gz."""
+    if filename.endswith(".gz"):
+        raw = gzip.open(filename, mode + "b", compresslevel=GZIP_LEVEL)
+        buffered = io.BufferedReader(raw, BUFFER_SIZE) if mode == "r" else io.BufferedWriter(raw, BUFFER_SIZE)
+        return io.TextIOWrapper(buffered, encoding="utf-8")
+    return open(filename, mode, encoding="utf-8", buffering=BUFFER_SIZE)
+
+
+def blocks(f) -> Iterator[List[str]]:
+    """Read a file in blocks of lines."""
+    return iter(lambda: list(itertools.islice(f, BLOCK_SIZE)), [])
+
+
+def separate(filename : str, source : str, target : str) -> int:
+    """Separate a file with a source and target sequence per line, separated
+    by a tab, into a source and a target file. Returns the number of lines."""
+    n = 0
+    with open_file(filename) as f_i, open_file(source, "w") as f_s, open_file(target, "w") as f_t:
+        for block in blocks(f_i):
+            sources, targets = [], []
+            for line in block:
+                try:
+                    [s, t] = line.split("\t")
+                except ValueError:
+                    raise ValueError("Line {} of {} does not hold a source and target separated by a tab."
+                                     .format(n + len(sources) + 1, filename)) from None
+                sources.append(s.strip())
+                targets.append(t.strip())
+            sources.append("")
+            targets.append("")
+            f_s.write("\n".join(sources))
+            f_t.write("\n".join(targets))
+            n += len(block)
+    return n
+
+
+def join(source : str, target : str, filename : str) -> int:
+    """Join a source and a target file into one file with the source and
+    target sequence per line, separated by a tab. Returns the number of
+    lines."""
+    n = 0
+    with open_file(source) as f_s, open_file(target) as f_t, open_file(filename, "w") as f_o:
+        for sources, targets in itertools.zip_longest(blocks(f_s), blocks(f_t), fillvalue=[]):
+            lines = ["{}\t{}\n".format(s.strip(), t.strip()) for s, t in zip(sources, targets)]
+            f_o.write("".join(lines))
+            n += len(lines)
+            if len(sources) != len(targets):
+                logging.warning("{} and {} have a different number of lines, the remaining lines are skipped."
+                                .format(source, target))
+                break
+    return n
+
+
+def split_name(filename : str) -> Tuple[str, str]:
+    """Split a file name into a name and an extension, keeping .gz as part of
+    the extension."""
+    compressed = ".gz" if filename.endswith(".gz") else ""
+    name, extension = os.path.splitext(filename[:len(filename) - len(compressed)])
+    return name, extension + compressed
+
+
+def output_name(name : str, extension : str, compress : bool) -> str:
+    if compress and not extension.endswith(".gz"):
+        extension += ".gz"
+    return name + extension
+
+
+def separate_folder(folder : str, output : str, workers : int=1, compress : bool=False) -> int:
+    """Separate every file of a folder into `<name>_src.<ext>' and
+    `<name>_tgt.<ext>' files in the output folder, with a pool of processes.
+    Files that are already separated are skipped. Returns the number of
+    files."""
+    jobs = []
+    for file in sorted(os.listdir(folder)):
+        if os.path.isdir(os.path.join(folder, file)): continue
+        name, extension = split_name(file)
+        if "src" in name or "tgt" in name: continue
+        jobs.append((os.path.join(folder, file),
+                     os.path.join(output, output_name(name + "_src", extension, compress)),
+                     os.path.join(output, output_name(name + "_tgt", extension, compress))))
+    return _run(separate, jobs, workers)
+
+
+def join_folder(folder : str, output : str, workers : int=1, compress : bool=False) -> int:
+    """Join every pair of `<name>_src.<ext>' and `<name>_tgt.<ext>' files of
+    a folder into `<name>.<ext>' in the output folder, with a pool of
+    processes. Returns the number of files."""
+    jobs = []
+    files = set(os.listdir(folder))
+    for file in sorted(files):
+        name, extension = split_name(file)
+        if not name.endswith("_src"): continue
+        target = name[:-len("_src")] + "_tgt" + extension
+        if target not in files:
+            logging.warning("{} has no target file, it is skipped.".format(file))
+            continue
+        jobs.append((os.path.join(folder, file), os.path.join(folder, target),
+                     os.path.join(output, output_name(name[:-len("_src")], extension, compress))))
+    return _run(join, jobs, workers)
+
+
+def _run(function, jobs : List[Tuple], workers : int) -> int:
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(min(workers, len(jobs))) as executor:
+            futures = [executor.submit(function, *job) for job in jobs]
+            lines = [future.result() for future in futures]
+    else:
+        lines = [function(*job) for job in jobs]
+    for job, n in zip(jobs, lines):
+        logging.info("Converted {} lines to {}.".format(n, ", ".join(job[1:]) if function is separate else job[-1]))
+    return len(jobs)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description="Join source and target files into tab separated files, or separate them, for single files or whole folders.")
+    parser.add_argument('action', choices=["join", "separate"])
+    parser.add_argument('-i', '--input', type=str, help="Input file to separate, or input folder.")
+    parser.add_argument('-s', '--source', type=str, help="Source file.")
+    parser.add_argument('-t', '--target', type=str, help="Target file.")
+    parser.add_argument('-o', '--output', type=str, help="Joined output file, or output folder.")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="Number of files converted at once.")
+    parser.add_argument('--gzip', action="store_true", help="Compress the files written to a folder.")
+    parser.add_argument('--log_level', type=str, default="info")
+    args = vars(parser.parse_args())
+    logging.basicConfig(level=args["log_level"].upper(),
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args["input"] is not None and os.path.isdir(args["input"]):
+        if args["output"] is None:
+            logging.error("Please enter an output folder.")
+        else:
+            os.makedirs(args["output"], exist_ok=True)
+            convert = join_folder if args["action"] == "join" else separate_folder
+            convert(args["input"], args["output"], args["workers"], args["gzip"])
+    elif args["action"] == "separate":
+        if args["input"] is None or not os.path.isfile(args["input"]):
+            logging.error("Please enter an existing input file.")
+        elif args["source"] is None or args["target"] is None:
+            logging.error("Please enter a source and a target file.")
+        else:
+            separate(args["input"], args["source"], args["target"])
+    else:
+        if args["source"] is None or not os.path.isfile(args["source"]):
+            logging.error("Please enter an existing source file.")
+        elif args["target"] is None or not os.path.isfile(args["target"]):
+            logging.error("Please enter an existing target file.")
+        elif args["output"] is None:
+            logging.error("Please enter an output file.")
+        else:
+            join(args["source"], args["target"], args["output"])
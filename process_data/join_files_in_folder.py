@@ -1,3 +1,21 @@
+import argparse
+import os
+import logging
+
+from convert import join_folder
+
 
 if __name__ == '__main__':
-    raise NotImplementedError()
\ No newline at end of file
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input', type=str, required=True, help="Input folder.")
+    parser.add_argument('-o', '--output', type=str, required=True, help="Output folder.")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="Number of files joined at once.")
+    parser.add_argument('--gzip', action="store_true", help="Compress the joined files.")
+    args = vars(parser.parse_args())
+
+    if not os.path.exists(args["input"]):
+        logging.error("Please enter an existing input folder.")
+    else:
+        os.makedirs(args["output"], exist_ok=True)
+        join_folder(args["input"], args["output"], args["workers"], args["gzip"])
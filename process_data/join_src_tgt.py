@@ -1,8 +1,9 @@
 import argparse
 import os
-import codecs
 import logging
 
+from convert import join
+
 
 if __name__ == '__main__':
 
@@ -18,10 +19,4 @@ if __name__ == '__main__':
     elif not os.path.isfile(args["target"]):
         logging.error("Please enter an existing target file.")
     else:
-        with codecs.open(args["source"], 'r', "utf-8") as f_s, \
-             codecs.open(args["target"], 'r', "utf-8") as f_t, \
-             codecs.open(args["output"], 'w', "utf-8") as f_o:
-            for source, target in zip(f_s, f_t):
-                source = source.strip()
-                target = target.strip()
-                f_o.write("{}\t{}\n".format(source, target))
+        join(args["source"], args["target"], args["output"])
@@ -1,8 +1,9 @@
 import argparse
 import os
-import codecs
 import logging
 
+from convert import separate
+
 
 if __name__ == '__main__':
 
@@ -16,12 +17,4 @@ if __name__ == '__main__':
     if not os.path.isfile(args["input"]):
         logging.error("Please enter an existing input file.")
     else:
-        with codecs.open(args["source"], 'w', "utf-8") as f_s, \
-             codecs.open(args["target"], 'w', "utf-8") as f_t, \
-             codecs.open(args["input"], 'r', "utf-8") as f_i:
-            for line in f_i:
-                [source, target] = line.split("\t")
-                source = source.strip()
-                target = target.strip()
-                f_s.write("{}\n".format(source))
-                f_t.write("{}\n".format(target))
\ No newline at end of file
+        separate(args["input"], args["source"], args["target"])